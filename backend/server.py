@@ -1,32 +1,171 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Depends, Header
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Depends, Header, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import StreamingResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.status import WS_1008_POLICY_VIOLATION, WS_1011_INTERNAL_ERROR
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from pymongo import IndexModel, ReturnDocument, UpdateOne, UpdateMany, monitoring
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from gridfs.errors import FileExists
 import os
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set
 import uuid
 from datetime import datetime, timezone, timedelta
 import httpx
+import numpy as np
 import base64
 import json
+import time
+import re
+import hashlib
+import io
+import binascii
+import gzip
+import threading
+from contextvars import ContextVar
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+try:
+    from PIL import Image
+except ImportError:  # Thumbnails are skipped when Pillow is not installed
+    Image = None
+
+try:
+    import brotli
+except ImportError:  # Responses are only gzip-compressed when Brotli is not installed
+    brotli = None
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# ==================== MONGO COMMAND MONITORING ====================
+
+class RequestMetrics:
+    """Mongo commands issued while serving one request"""
+
+    def __init__(self):
+        self.commands: List[tuple] = []  # (command, collection, seconds, description)
+        self.pending: Dict[int, tuple] = {}  # pymongo request_id -> (command, collection, description)
+
+# Set by MetricsMiddleware; Motor copies the context into its executor threads
+current_request_metrics: ContextVar[Optional[RequestMetrics]] = ContextVar("current_request_metrics", default=None)
+
+# command name -> {"count", "failures", "seconds"} across the whole process
+db_command_stats: Dict[str, Dict[str, float]] = {}
+db_command_stats_lock = threading.Lock()
+
+def describe_command(command_name: str, command: Dict[str, Any]) -> str:
+    """Shape of a command for budget reports: the filtered fields or pipeline stages, never values"""
+    if command.get("pipeline"):
+        return "pipeline=" + ",".join(next(iter(stage), "?") for stage in command["pipeline"])
+    for key in ("filter", "query"):
+        if isinstance(command.get(key), dict):
+            return f"{key}=" + ",".join(sorted(command[key]))
+    for key in ("updates", "deletes"):
+        if command.get(key):
+            return f"{len(command[key])} {key} q=" + ",".join(sorted(command[key][0].get("q", {})))
+    if command.get("documents"):
+        return f"{len(command['documents'])} documents"
+    return ""
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Count Mongo round trips and their time, globally and for the current request"""
+
+    def started(self, event):
+        metrics = current_request_metrics.get()
+        if metrics is not None:
+            target = event.command.get(event.command_name)
+            collection = target if isinstance(target, str) else event.command.get("collection")
+            # Descriptions are only needed for query budget reports
+            description = describe_command(event.command_name, event.command) if QUERY_BUDGET_MODE != "off" else ""
+            metrics.pending[event.request_id] = (event.command_name, collection, description)
+
+    def succeeded(self, event):
+        self.finish(event, failed=False)
+
+    def failed(self, event):
+        self.finish(event, failed=True)
+
+    def finish(self, event, failed: bool):
+        seconds = event.duration_micros / 1_000_000
+        with db_command_stats_lock:
+            stats = db_command_stats.setdefault(event.command_name, {"count": 0, "failures": 0, "seconds": 0.0})
+            stats["count"] += 1
+            stats["failures"] += int(failed)
+            stats["seconds"] += seconds
+        metrics = current_request_metrics.get()
+        if metrics is not None:
+            command, collection, description = metrics.pending.pop(event.request_id, (event.command_name, None, ""))
+            metrics.commands.append((command, collection, seconds, description))
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandListener()])
 db = client[os.environ['DB_NAME']]
 
+# Content-addressed media storage (GridFS, file _id = sha256 of the bytes)
+media_bucket = AsyncIOMotorGridFSBucket(db, bucket_name="media")
+MEDIA_MAX_BYTES = int(os.environ.get('MEDIA_MAX_BYTES', str(10 * 1024 * 1024)))
+MEDIA_THUMBNAIL_PX = int(os.environ.get('MEDIA_THUMBNAIL_PX', '256'))
+# Host prefixed to media paths in responses (defaults to the host the request came in on)
+PUBLIC_BASE_URL = os.environ.get('PUBLIC_BASE_URL', '').rstrip('/')
+
 # Z.ai API configuration
 ZAI_API_KEY = os.environ.get('ZAI_API_KEY', '6422740a283342afa95ded10fbb5ea.njMvimW35vveFkyT')
-ZAI_API_URL = 'https://api.z.ai/api/paas/v4/chat/completions'
+ZAI_API_URL = os.environ.get('ZAI_API_URL', 'https://api.z.ai/api/paas/v4/chat/completions')
+ZAI_TIMEOUT_SECONDS = float(os.environ.get('ZAI_TIMEOUT_SECONDS', '30'))
+ZAI_MAX_CONNECTIONS = int(os.environ.get('ZAI_MAX_CONNECTIONS', '20'))
+ZAI_MAX_CONCURRENCY = int(os.environ.get('ZAI_MAX_CONCURRENCY', '10'))
+ZAI_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('ZAI_QUEUE_TIMEOUT_SECONDS', '2'))
+ZAI_BREAKER_FAILURES = int(os.environ.get('ZAI_BREAKER_FAILURES', '5'))
+ZAI_BREAKER_RESET_SECONDS = float(os.environ.get('ZAI_BREAKER_RESET_SECONDS', '30'))
+# Recommended jobs feed
+RECOMMEND_MAX_CANDIDATES = int(os.environ.get('RECOMMEND_MAX_CANDIDATES', '100000'))
+RECOMMEND_RADIUS_KM = float(os.environ.get('RECOMMEND_RADIUS_KM', '50'))
+RECOMMEND_REFRESH_SECONDS = float(os.environ.get('RECOMMEND_REFRESH_SECONDS', '30'))
+RECOMMEND_MIN_REBUILD_SECONDS = float(os.environ.get('RECOMMEND_MIN_REBUILD_SECONDS', '5'))
+
+AI_CACHE_TTL_SECONDS = float(os.environ.get('AI_CACHE_TTL_SECONDS', '3600'))
+AI_CACHE_MAX_ENTRIES = int(os.environ.get('AI_CACHE_MAX_ENTRIES', '2000'))
+
+# Session cache configuration
+SESSION_CACHE_TTL_SECONDS = float(os.environ.get('SESSION_CACHE_TTL_SECONDS', '60'))
+SESSION_CACHE_MAX_ENTRIES = int(os.environ.get('SESSION_CACHE_MAX_ENTRIES', '10000'))
+
+# Background task pipeline (durable outbox in db.task_outbox)
+TASK_WORKERS = int(os.environ.get('TASK_WORKERS', '2'))
+TASK_MAX_ATTEMPTS = int(os.environ.get('TASK_MAX_ATTEMPTS', '5'))
+TASK_RETRY_BASE_SECONDS = float(os.environ.get('TASK_RETRY_BASE_SECONDS', '2'))
+TASK_POLL_SECONDS = float(os.environ.get('TASK_POLL_SECONDS', '5'))
+TASK_LEASE_SECONDS = float(os.environ.get('TASK_LEASE_SECONDS', '60'))
+TASK_RETENTION_SECONDS = int(os.environ.get('TASK_RETENTION_SECONDS', str(7 * 24 * 3600)))
+
+# Response compression
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+COMPRESSION_OFFLOAD_BYTES = int(os.environ.get('COMPRESSION_OFFLOAD_BYTES', str(64 * 1024)))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6'))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '5'))
+
+# Per-request query/latency budgets: off, log (warn when exceeded) or raise (fail, for test runs)
+QUERY_BUDGET_MODE = os.environ.get('QUERY_BUDGET_MODE', 'off')
+QUERY_BUDGET_MAX_OPERATIONS = int(os.environ.get('QUERY_BUDGET_MAX_OPERATIONS', '10'))
+QUERY_BUDGET_MAX_SECONDS = float(os.environ.get('QUERY_BUDGET_MAX_SECONDS', '0.5'))
+# Same command on the same collection this many times in one request looks like N+1
+QUERY_BUDGET_MAX_REPEATS = int(os.environ.get('QUERY_BUDGET_MAX_REPEATS', '5'))
+# JSON overrides per route, e.g. {"GET /api/jobs/recommended": {"operations": 20, "seconds": 1.0}}
+QUERY_BUDGET_ROUTES = json.loads(os.environ.get('QUERY_BUDGET_ROUTES', '{}'))
 
 # Create the main app
-app = FastAPI(title="NomadShift API")
+# orjson encodes datetimes natively and is several times faster than the stdlib encoder
+app = FastAPI(title="NomadShift API", default_response_class=ORJSONResponse)
 
 # Create router with /api prefix
 api_router = APIRouter(prefix="/api")
@@ -55,19 +194,22 @@ class UserProfile(BaseModel):
     name: str
     age: Optional[int] = None
     bio: Optional[str] = None
-    photo: Optional[str] = None  # base64
+    photo: Optional[str] = None  # media URL
+    photo_thumb: Optional[str] = None  # media URL of the thumbnail
     skills: List[str] = []
     location: Optional[Dict[str, float]] = None  # {lat, lng}
     address: Optional[str] = None
     # Business specific
     business_name: Optional[str] = None
-    business_photos: List[str] = []  # base64 images
+    business_photos: List[str] = []  # media URLs
     # Worker specific
     prestige_score: int = 0
     badges: List[str] = []
     completed_jobs: int = 0
     rating: float = 0.0
     rating_count: int = 0
+    rating_sum: int = 0
+    rating_histogram: Dict[str, int] = {}  # star -> count
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -121,6 +263,7 @@ class ChatRoom(BaseModel):
     job_id: Optional[str] = None
     last_message: Optional[str] = None
     last_message_time: Optional[datetime] = None
+    unread_counts: Dict[str, int] = {}  # user_id -> messages not yet read
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class SessionData(BaseModel):
@@ -177,6 +320,1363 @@ class CreateReviewRequest(BaseModel):
 class SendMessageRequest(BaseModel):
     content: str
 
+# ==================== PROJECTIONS ====================
+
+# Internal fields (GeoJSON point, skill bitmask, applied task keys) never sent to clients
+JOB_PUBLIC_PROJECTION = {"_id": 0, "geo": 0, "skills_mask": 0}
+PROFILE_PUBLIC_PROJECTION = {"_id": 0, "geo": 0, "skills_mask": 0, "applied_tasks": 0}
+
+# Worker fields shown on applicant cards (no business data, no gallery)
+WORKER_CARD_PROJECTION = {
+    "_id": 0,
+    "user_id": 1,
+    "name": 1,
+    "age": 1,
+    "bio": 1,
+    "photo": 1,
+    "photo_thumb": 1,
+    "skills": 1,
+    "badges": 1,
+    "prestige_score": 1,
+    "completed_jobs": 1,
+    "rating": 1,
+    "rating_count": 1
+}
+
+# Other participant shown in the chat list and chat header
+PARTICIPANT_SUMMARY_PROJECTION = {
+    "_id": 0,
+    "user_id": 1,
+    "role": 1,
+    "name": 1,
+    "business_name": 1,
+    "photo": 1,
+    "photo_thumb": 1,
+    "rating": 1
+}
+
+# Job banner shown on chat rooms
+JOB_SUMMARY_PROJECTION = {
+    "_id": 0,
+    "job_id": 1,
+    "title": 1,
+    "category": 1,
+    "business_name": 1,
+    "hourly_rate": 1,
+    "duration_hours": 1,
+    "address": 1,
+    "status": 1
+}
+
+# ==================== FIELD SELECTION HELPERS ====================
+
+# Named lightweight views, selected with ?view=
+JOB_VIEWS = {
+    # Map pins: distance_km is added by location searches
+    "pin": ["job_id", "title", "hourly_rate", "location"],
+    # List rows: everything but the long description
+    "card": [
+        "job_id", "title", "category", "business_name", "hourly_rate", "duration_hours",
+        "address", "location", "skills_required", "status", "created_at"
+    ],
+}
+PROFILE_VIEWS = {
+    "card": [field for field in WORKER_CARD_PROJECTION if field != "_id"],
+    "summary": [field for field in PARTICIPANT_SUMMARY_PROJECTION if field != "_id"],
+}
+
+# Stored fields a client may select, and fields the endpoints compute per request
+# (computed fields are accepted in ?fields= but always returned)
+FIELD_SETS = {
+    "job": {
+        "id": "job_id",
+        "stored": set(Job.model_fields),
+        "computed": {"distance_km", "recommendation_score", "match_score", "application_status"},
+        "views": JOB_VIEWS,
+    },
+    "profile": {
+        "id": "user_id",
+        "stored": set(UserProfile.model_fields),
+        "computed": {"distance_km", "search_score"},
+        "views": PROFILE_VIEWS,
+    },
+}
+
+def field_projection(kind: str, fields: Optional[str], view: Optional[str]) -> Optional[Dict[str, int]]:
+    """Inclusion projection for ?fields=a,b or ?view=name (None: the full public document)"""
+    spec = FIELD_SETS[kind]
+    if fields:
+        requested = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [field for field in requested if field not in spec["stored"] | spec["computed"]]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    elif view:
+        if view not in spec["views"]:
+            raise HTTPException(status_code=400, detail=f"Unknown view: {view}")
+        requested = spec["views"][view]
+    else:
+        return None
+    
+    # The id is always returned so rows can be keyed and paged
+    projection = {"_id": 0, spec["id"]: 1}
+    projection.update({field: 1 for field in requested if field in spec["stored"]})
+    return projection
+
+# ==================== GEO HELPERS ====================
+
+def geo_point(location: Optional[Dict[str, float]]) -> Optional[Dict[str, Any]]:
+    """Convert a {lat, lng} dict into a GeoJSON Point (None if incomplete or out of range)"""
+    if not location:
+        return None
+    lat = location.get("lat")
+    lng = location.get("lng")
+    if lat is None or lng is None:
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    # GeoJSON orders coordinates as [longitude, latitude]
+    return {"type": "Point", "coordinates": [lng, lat]}
+
+async def backfill_geo_points():
+    """Add GeoJSON points to jobs and profiles stored before the 2dsphere searches"""
+    for collection in (db.jobs, db.profiles):
+        await collection.update_many(
+            {
+                "geo": {"$exists": False},
+                "location.lat": {"$gte": -90, "$lte": 90},
+                "location.lng": {"$gte": -180, "$lte": 180}
+            },
+            [{"$set": {"geo": {"type": "Point", "coordinates": ["$location.lng", "$location.lat"]}}}]
+        )
+
+# ==================== PAGINATION HELPERS ====================
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 100
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+HAS_MORE_HEADER = "X-Has-More"
+
+def encode_cursor(value: Any, item_id: str) -> str:
+    """Encode the (sort value, id) of the last item of a page as an opaque cursor"""
+    if isinstance(value, datetime):
+        payload = {"t": "dt", "v": value.isoformat(), "id": item_id}
+    else:
+        payload = {"t": "raw", "v": value, "id": item_id}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decode an opaque cursor back into its (sort value, id) pair"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = payload["v"]
+        if payload["t"] == "dt" and value is not None:
+            value = datetime.fromisoformat(value)
+        return value, str(payload["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_filter(sort_field: str, id_field: str, cursor: str, descending: bool = True) -> Dict[str, Any]:
+    """Build the seek condition that resumes a (sort_field, id_field) ordered scan after cursor"""
+    value, last_id = decode_cursor(cursor)
+    return seek_filter(sort_field, id_field, value, last_id, descending)
+
+def seek_filter(sort_field: str, id_field: str, value: Any, last_id: str, descending: bool = True) -> Dict[str, Any]:
+    """Condition matching the items ordered after (value, last_id)"""
+    op = "$lt" if descending else "$gt"
+    tie = {sort_field: value, id_field: {op: last_id}}
+    # Nulls sort lowest: they are the tail of a descending scan and the head of an ascending one
+    if value is None:
+        if descending:
+            return tie
+        return {"$or": [tie, {sort_field: {"$ne": None}}]}
+    clauses = [{sort_field: {op: value}}, tie]
+    if descending:
+        clauses.append({sort_field: None})
+    return {"$or": clauses}
+
+async def paginate(
+    collection,
+    query: Dict[str, Any],
+    sort_field: str,
+    id_field: str,
+    cursor: Optional[str],
+    limit: int,
+    descending: bool = True,
+    projection: Optional[Dict[str, Any]] = None
+) -> tuple:
+    """Fetch one keyset page; returns (docs, next_cursor)"""
+    if cursor:
+        query = {"$and": [query, keyset_filter(sort_field, id_field, cursor, descending)]}
+    direction = -1 if descending else 1
+    # A sparse inclusion projection still needs the cursor fields; they are dropped again below
+    hidden = []
+    if projection and any(value == 1 for key, value in projection.items() if key != "_id"):
+        hidden = [field for field in (sort_field, id_field) if field not in projection]
+        projection = {**projection, **{field: 1 for field in hidden}}
+    docs = await collection.find(query, projection or {"_id": 0}).sort(
+        [(sort_field, direction), (id_field, direction)]
+    ).to_list(limit + 1)
+    
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        next_cursor = encode_cursor(last.get(sort_field), last[id_field])
+    for doc in docs:
+        for field in hidden:
+            doc.pop(field, None)
+    return docs, next_cursor
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    """Expose the next page cursor without changing list response bodies"""
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+def json_list(docs: List[Dict[str, Any]], response: Optional[Response] = None) -> ORJSONResponse:
+    """Encode Mongo documents straight to JSON, skipping FastAPI's jsonable_encoder pass
+
+    The documents are plain dicts of JSON types and datetimes, which orjson handles
+    directly; headers already set on the injected response (cursors) are kept.
+    """
+    headers = dict(response.headers) if response is not None else None
+    return ORJSONResponse(docs, headers=headers)
+
+# ==================== CACHE HELPERS ====================
+
+class TTLCache:
+    """Bounded in-process LRU cache whose entries expire after a TTL"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        # Bumped by every invalidation, so a value loaded before one is not cached after it
+        self.generation = 0
+
+    def get(self, key: Any) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Any, value: Any, ttl_seconds: Optional[float] = None, generation: Optional[int] = None):
+        """Cache value; skipped if generation (read before loading it) is no longer current"""
+        if generation is not None and generation != self.generation:
+            return
+        ttl = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        if ttl <= 0:
+            return
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Any):
+        self.generation += 1
+        self._entries.pop(key, None)
+
+    def pop_where(self, predicate):
+        """Drop every entry whose value matches predicate"""
+        self.generation += 1
+        for key in [k for k, (value, _) in self._entries.items() if predicate(value)]:
+            del self._entries[key]
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+# session_token -> User, never kept past the session's own expiry
+session_cache = TTLCache(SESSION_CACHE_MAX_ENTRIES, SESSION_CACHE_TTL_SECONDS)
+
+def invalidate_user_sessions(user_id: str):
+    """Forget cached sessions of a user after their user document changes"""
+    session_cache.pop_where(lambda user: user.user_id == user_id)
+
+# ==================== HTTP CACHING HELPERS ====================
+
+# Static lists: reuse for an hour, then revalidate with the ETag
+STATIC_CACHE_CONTROL = "public, max-age=3600, stale-while-revalidate=86400"
+# Mutable documents: always revalidate, a matching ETag costs a 304 instead of the body
+DOCUMENT_CACHE_CONTROL = "public, no-cache"
+
+def content_etag(payload: Any) -> str:
+    """Strong ETag over the canonical JSON form of a response body"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return '"' + hashlib.sha256(canonical.encode()).hexdigest()[:32] + '"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 requires for GET)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return etag in candidates
+
+def conditional_response(request: Request, response: Response, payload: Any,
+                         cache_control: str, etag: Optional[str] = None):
+    """Return payload with ETag/Cache-Control set, or a bodiless 304 if the client's copy is current"""
+    etag = etag or content_etag(payload)
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return payload
+
+# ==================== COMPRESSION HELPERS ====================
+
+# Preferred first when the client weighs them equally
+COMPRESSION_ENCODINGS = (["br"] if brotli else []) + ["gzip"]
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+compression_stats = {
+    "compressed": 0,
+    "skipped_small": 0,
+    "offloaded": 0,
+    "bytes_in": 0,
+    "bytes_out": 0,
+    "seconds": 0.0,
+    "by_encoding": {encoding: 0 for encoding in COMPRESSION_ENCODINGS}
+}
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Best supported content-coding for an Accept-Encoding header (None: send identity)"""
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+    
+    best, best_q = None, 0.0
+    for encoding in COMPRESSION_ENCODINGS:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+
+class CompressionMiddleware:
+    """Compress complete response bodies above COMPRESSION_MIN_BYTES
+
+    Streaming responses (SSE) and already-encoded or binary bodies pass through.
+    Large bodies are compressed in the threadpool so the event loop keeps serving.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+        
+        start_message = None
+        passthrough = False
+        
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            
+            headers = MutableHeaders(raw=start_message["headers"])
+            body = message.get("body", b"")
+            compressible = (
+                start_message["status"] not in (204, 304)
+                and "content-encoding" not in headers
+                and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            )
+            if message.get("more_body") or not compressible or len(body) < COMPRESSION_MIN_BYTES:
+                if compressible and not message.get("more_body"):
+                    compression_stats["skipped_small"] += 1
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+            
+            started = time.perf_counter()
+            if len(body) >= COMPRESSION_OFFLOAD_BYTES:
+                compressed = await run_in_threadpool(compress_body, body, encoding)
+                compression_stats["offloaded"] += 1
+            else:
+                compressed = compress_body(body, encoding)
+            compression_stats["seconds"] += time.perf_counter() - started
+            compression_stats["compressed"] += 1
+            compression_stats["by_encoding"][encoding] += 1
+            compression_stats["bytes_in"] += len(body)
+            compression_stats["bytes_out"] += len(compressed)
+            
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            # The encoded bytes differ from the identity body, so the ETag is only weakly equal
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = "W/" + etag
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed})
+        
+        await self.app(scope, receive, send_compressed)
+
+# ==================== METRICS HELPERS ====================
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# (method, route template) -> latency histogram, status counts and Mongo usage
+route_stats: Dict[tuple, Dict[str, Any]] = {}
+
+def record_request(method: str, route: str, status: int, seconds: float, metrics: RequestMetrics):
+    stats = route_stats.get((method, route))
+    if stats is None:
+        stats = route_stats[(method, route)] = {
+            "buckets": [0] * len(LATENCY_BUCKETS),
+            "count": 0,
+            "seconds": 0.0,
+            "statuses": {},
+            "db_operations": 0,
+            "db_seconds": 0.0
+        }
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if seconds <= bound:
+            stats["buckets"][i] += 1
+    stats["count"] += 1
+    stats["seconds"] += seconds
+    stats["statuses"][status] = stats["statuses"].get(status, 0) + 1
+    stats["db_operations"] += len(metrics.commands)
+    stats["db_seconds"] += sum(command[2] for command in metrics.commands)
+
+class MetricsMiddleware:
+    """Time each HTTP request and attribute the Mongo commands it issues to its route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        metrics = RequestMetrics()
+        token = current_request_metrics.set(metrics)
+        status = 500
+        
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_request_metrics.reset(token)
+            # The router stores the matched route in the scope; templates keep label cardinality bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            seconds = time.perf_counter() - started
+            record_request(scope["method"], route, status, seconds, metrics)
+        if QUERY_BUDGET_MODE != "off":
+            check_query_budget(scope["method"], route, seconds, metrics)
+
+class QueryBudgetExceeded(Exception):
+    """A request issued more Mongo commands, or took longer, than its route allows"""
+
+def check_query_budget(method: str, route: str, seconds: float, metrics: RequestMetrics):
+    """Log or raise (QUERY_BUDGET_MODE) when a request breaks its query or latency budget"""
+    budget = QUERY_BUDGET_ROUTES.get(f"{method} {route}", {})
+    max_operations = budget.get("operations", QUERY_BUDGET_MAX_OPERATIONS)
+    max_seconds = budget.get("seconds", QUERY_BUDGET_MAX_SECONDS)
+    max_repeats = budget.get("repeats", QUERY_BUDGET_MAX_REPEATS)
+    
+    problems = []
+    if len(metrics.commands) > max_operations:
+        problems.append(f"{len(metrics.commands)} Mongo operations (budget {max_operations})")
+    if seconds > max_seconds:
+        problems.append(f"{seconds * 1000:.0f}ms (budget {max_seconds * 1000:.0f}ms)")
+    repeats = {}
+    for command, collection, _, _ in metrics.commands:
+        repeats[(command, collection)] = repeats.get((command, collection), 0) + 1
+    for (command, collection), count in repeats.items():
+        if count > max_repeats:
+            problems.append(f"{command} on {collection} repeated {count} times (possible N+1)")
+    if not problems:
+        return
+    
+    queries = "\n".join(
+        f"  {i}. {command} {collection or ''} {description} ({elapsed * 1000:.1f}ms)".rstrip()
+        for i, (command, collection, elapsed, description) in enumerate(metrics.commands, 1)
+    )
+    message = f"{method} {route} exceeded its budget: {'; '.join(problems)}\nQueries issued:\n{queries}"
+    if QUERY_BUDGET_MODE == "raise":
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+def prometheus_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        f'{key}="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+def prometheus_family(name: str, kind: str, help_text: str, samples: List[tuple]) -> List[str]:
+    """Exposition lines for one metric; samples are (suffix, labels, value)"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for suffix, labels, value in samples:
+        lines.append(f"{name}{suffix}{prometheus_labels(labels)} {value}")
+    return lines
+
+# ==================== MEDIA HELPERS ====================
+
+MEDIA_PATH = "/api/media/"
+# Profile fields holding image references
+MEDIA_FIELDS = ("photo", "photo_thumb")
+MEDIA_LIST_FIELDS = ("business_photos",)
+
+def media_url(media_hash: str, variant: Optional[str] = None) -> str:
+    """Host-independent path of a stored blob, as kept in documents"""
+    url = f"{MEDIA_PATH}{media_hash}"
+    if variant:
+        url += f"?variant={variant}"
+    return url
+
+def media_base_url(request: Request) -> str:
+    return PUBLIC_BASE_URL or str(request.base_url).rstrip("/")
+
+def absolute_media_url(value: Any, base_url: str) -> Any:
+    """Prefix a stored media path with the public host; other values pass through"""
+    if isinstance(value, str) and value.startswith(MEDIA_PATH):
+        return base_url + value
+    return value
+
+def with_media_urls(profile: Optional[Dict[str, Any]], request: Request) -> Optional[Dict[str, Any]]:
+    """Turn the stored media paths of a profile into absolute URLs clients can load"""
+    if not profile:
+        return profile
+    base_url = media_base_url(request)
+    for field in MEDIA_FIELDS:
+        if field in profile:
+            profile[field] = absolute_media_url(profile[field], base_url)
+    for field in MEDIA_LIST_FIELDS:
+        if profile.get(field):
+            profile[field] = [absolute_media_url(value, base_url) for value in profile[field]]
+    return profile
+
+def decode_image_data(value: str) -> tuple:
+    """Split a data URI or bare base64 string into (bytes, content_type)"""
+    content_type = None
+    payload = value
+    if value.startswith("data:"):
+        header, _, payload = value.partition(",")
+        content_type = header[5:].split(";")[0] or None
+    try:
+        data = base64.b64decode(payload, validate=True)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid image")
+    if not data:
+        raise HTTPException(status_code=400, detail="Invalid image")
+    if len(data) > MEDIA_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Image too large")
+    return data, content_type
+
+def make_thumbnail(data: bytes) -> tuple:
+    """Return (thumbnail JPEG bytes, source content type); CPU bound, run off the event loop"""
+    if Image is None:
+        return None, None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            content_type = Image.MIME.get(image.format)
+            image.thumbnail((MEDIA_THUMBNAIL_PX, MEDIA_THUMBNAIL_PX))
+            out = io.BytesIO()
+            image.convert("RGB").save(out, format="JPEG", quality=80, optimize=True)
+            return out.getvalue(), content_type
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid image")
+
+async def store_blob(data: bytes, content_type: str, metadata: Optional[Dict[str, Any]] = None) -> str:
+    """Store bytes once under their sha256; returns the hash"""
+    media_hash = hashlib.sha256(data).hexdigest()
+    existing = await db["media.files"].find_one({"_id": media_hash}, {"_id": 1})
+    if existing:
+        return media_hash
+    try:
+        await media_bucket.upload_from_stream_with_id(
+            media_hash,
+            media_hash,
+            data,
+            metadata={"content_type": content_type, **(metadata or {})}
+        )
+    except FileExists:
+        # A concurrent upload of the same content won the race (GridFS reports
+        # duplicate file or chunk inserts as FileExists, not DuplicateKeyError)
+        pass
+    return media_hash
+
+async def store_image(value: Optional[str]) -> tuple:
+    """Move an inline base64 image into the blob store; returns (url, thumbnail url)"""
+    if not value:
+        return value, None
+    if MEDIA_PATH in value:
+        # Already stored (possibly echoed back as an absolute URL): keep only the path;
+        # the media endpoint falls back to the original if there is no thumbnail
+        path = MEDIA_PATH + value.split(MEDIA_PATH, 1)[1].split("?")[0]
+        return path, path + "?variant=thumb"
+    if value.startswith(("http://", "https://")):
+        return value, None
+    data, content_type = decode_image_data(value)
+    thumbnail, detected_type = await run_in_threadpool(make_thumbnail, data)
+    content_type = detected_type or content_type or "application/octet-stream"
+    
+    metadata = {}
+    if thumbnail:
+        metadata["thumbnail"] = await store_blob(thumbnail, "image/jpeg")
+    media_hash = await store_blob(data, content_type, metadata)
+    return media_url(media_hash), media_url(media_hash, "thumb") if thumbnail else None
+
+async def store_images(values: List[str]) -> List[str]:
+    """Store a gallery of inline images, keeping order"""
+    stored = await asyncio.gather(*(store_image(value) for value in values))
+    return [url for url, _ in stored]
+
+async def migrate_inline_profile_images():
+    """Move base64 images still embedded in profiles into the blob store
+
+    Also rewrites media URLs stored with a host back to host-independent paths.
+    """
+    inline = {"$regex": "^data:"}
+    hosted = {"$regex": f"^https?://.*{MEDIA_PATH}"}
+    cursor = db.profiles.find(
+        {"$or": [
+            {"photo": inline}, {"business_photos": inline},
+            {"photo": hosted}, {"photo_thumb": hosted}, {"business_photos": hosted}
+        ]},
+        {"_id": 0, "user_id": 1, "photo": 1, "business_photos": 1}
+    )
+    migrated = 0
+    async for profile in cursor:
+        try:
+            photo, photo_thumb = await store_image(profile.get("photo"))
+            business_photos = await store_images(profile.get("business_photos") or [])
+        except HTTPException:
+            logger.warning(f"Skipping undecodable images of profile {profile['user_id']}")
+            continue
+        update = {"photo": photo, "business_photos": business_photos, "photo_thumb": photo_thumb}
+        await db.profiles.update_one({"user_id": profile["user_id"]}, {"$set": update})
+        migrated += 1
+    if migrated:
+        logger.info(f"Moved inline images of {migrated} profiles to the media store")
+
+# ==================== RATING HELPERS ====================
+
+# (badge, minimum rating_count, minimum average rating) awarded to workers
+RATING_BADGES = [
+    ("rising_star", 5, None),
+    ("trusted", 20, None),
+    ("top_rated", 10, 4.5),
+]
+
+def rating_update_pipeline(rating: int) -> List[Dict[str, Any]]:
+    """Update pipeline adding one rating to a profile's sum/count/histogram and badges"""
+    average = {"$divide": ["$rating_sum", "$rating_count"]}
+    
+    earned = []
+    for badge, min_count, min_average in RATING_BADGES:
+        rule = [{"$gte": ["$rating_count", min_count]}]
+        if min_average is not None:
+            rule.append({"$gte": [average, min_average]})
+        earned.append({"$cond": [{"$and": rule}, badge, None]})
+    badges = {"$ifNull": ["$badges", []]}
+    new_badges = {"$filter": {
+        "input": earned,
+        "as": "badge",
+        "cond": {"$and": [
+            {"$ne": ["$$badge", None]},
+            {"$not": [{"$in": ["$$badge", badges]}]}
+        ]}
+    }}
+    
+    return [
+        {"$set": {
+            # Profiles rated before the counters existed start from their stored average
+            "rating_sum": {"$add": [
+                {"$ifNull": [
+                    "$rating_sum",
+                    {"$multiply": [{"$ifNull": ["$rating", 0]}, {"$ifNull": ["$rating_count", 0]}]}
+                ]},
+                rating
+            ]},
+            "rating_count": {"$add": [{"$ifNull": ["$rating_count", 0]}, 1]},
+            f"rating_histogram.{rating}": {"$add": [{"$ifNull": [f"$rating_histogram.{rating}", 0]}, 1]}
+        }},
+        {"$set": {
+            "rating": {"$round": [average, 2]},
+            "badges": {"$cond": [
+                {"$eq": ["$role", "worker"]},
+                {"$concatArrays": [badges, new_badges]},
+                "$badges"
+            ]},
+            "updated_at": datetime.now(timezone.utc)
+        }}
+    ]
+
+# ==================== SKILL HELPERS ====================
+
+# Catalog served by /api/skills; seeds the skill bit registry in this order
+SKILLS_CATALOG = [
+    "Barista", "Cocina", "Atención al cliente", "Caja registradora",
+    "Limpieza", "Organización", "Manejo de inventario", "Conducir",
+    "Inglés", "Portugués", "Servicio de mesa", "Bartender",
+    "Seguridad", "Recepción", "Computación básica", "Excel",
+    "Redes sociales", "Fotografía", "Carga pesada", "Primeros auxilios"
+]
+
+# Catalog spelling of each skill, keyed by its casefolded form
+SKILL_CANONICAL_NAMES = {skill.casefold(): skill for skill in SKILLS_CATALOG}
+
+# skill name -> bit position; bits are never reused, so stored masks stay valid as skills are added
+skill_bits: Dict[str, int] = {}
+
+def normalize_skill(skill: str) -> str:
+    """Collapse whitespace and use the catalog spelling when the skill is in the catalog"""
+    cleaned = " ".join(skill.split())
+    return SKILL_CANONICAL_NAMES.get(cleaned.casefold(), cleaned)
+
+async def load_skill_registry():
+    """Load the persisted skill -> bit registry, seeding it from the catalog on first run"""
+    async for entry in db.skill_registry.find({}, {"_id": 0, "skill": 1, "bit": 1}):
+        skill_bits[entry["skill"]] = entry["bit"]
+    await register_skills(SKILLS_CATALOG)
+
+async def lookup_skill_bits(skills: List[str]) -> Dict[str, int]:
+    """Bit positions of already registered skills, reading the ones another process registered"""
+    missing = [skill for skill in set(skills) if skill not in skill_bits]
+    if missing:
+        async for entry in db.skill_registry.find({"skill": {"$in": missing}}, {"_id": 0, "skill": 1, "bit": 1}):
+            skill_bits[entry["skill"]] = entry["bit"]
+    return {skill: skill_bits[skill] for skill in skills if skill in skill_bits}
+
+async def register_skills(skills: List[str]) -> Dict[str, int]:
+    """Bit positions for skills, allocating new ones only for catalog skills.
+    
+    Free-text skills keep a bit registered before the catalog check, but no
+    new bits are handed out for them.
+    """
+    names = [name for name in dict.fromkeys(normalize_skill(skill) for skill in skills) if name]
+    known = await lookup_skill_bits(names)
+    for skill in names:
+        if skill in known or skill not in SKILLS_CATALOG:
+            continue
+        counter = await db.counters.find_one_and_update(
+            {"_id": "skill_bits"},
+            {"$inc": {"seq": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        bit = counter["seq"] - 1
+        try:
+            await db.skill_registry.insert_one({"skill": skill, "bit": bit})
+        except DuplicateKeyError:
+            # Another process registered it first; its bit wins
+            entry = await db.skill_registry.find_one({"skill": skill}, {"_id": 0, "bit": 1})
+            bit = entry["bit"]
+        skill_bits[skill] = known[skill] = bit
+    return known
+
+async def skills_mask(skills: List[str]) -> int:
+    """Bitmask of a skill list"""
+    mask = 0
+    for bit in (await register_skills(skills or [])).values():
+        mask |= 1 << bit
+    return mask
+
+def mask_to_bson(mask: int) -> bytes:
+    """Little-endian bytes, stored as BinData so the mask can grow past 64 skills"""
+    return mask.to_bytes(max((mask.bit_length() + 7) // 8, 1), "little")
+
+def skill_set(skills: Optional[List[str]]) -> Set[str]:
+    """Normalized, de-duplicated skill names"""
+    return {name for name in (normalize_skill(skill) for skill in skills or []) if name}
+
+def skill_match_score(worker_skills: Optional[List[str]], required_skills: Optional[List[str]]) -> float:
+    """Percentage of required skills the worker has (50 when the job requires none).
+    
+    Compares normalized names, so free-text skills without a bit count like catalog ones.
+    """
+    required = skill_set(required_skills)
+    if not required:
+        return 50.0
+    return len(required & skill_set(worker_skills)) / len(required) * 100
+
+def skill_name_pattern(skill: str) -> re.Pattern:
+    """Matches stored spellings of a normalized free-text skill (any surrounding or inner whitespace)"""
+    return re.compile(r"^\s*" + r"\s+".join(re.escape(word) for word in skill.split()) + r"\s*$")
+
+async def skills_filter(skills: List[str], field: str, match: str = "all") -> Optional[Dict[str, Any]]:
+    """Mongo condition for documents listing all (or any) of the given skills in field.
+    
+    Registered skills are matched on skills_mask; free-text skills without a bit
+    on the stored names. None when no skill was given.
+    """
+    wanted = skill_set(skills)
+    if not wanted:
+        return None
+    known = await lookup_skill_bits(list(wanted))
+    patterns = [skill_name_pattern(skill) for skill in sorted(wanted - set(known))]
+    bits = sorted(known.values())
+    if match == "any":
+        conditions = [{"skills_mask": {"$bitsAnySet": bits}}] if bits else []
+        if patterns:
+            conditions.append({field: {"$in": patterns}})
+        return conditions[0] if len(conditions) == 1 else {"$or": conditions}
+    condition = {"skills_mask": {"$bitsAllSet": bits}} if bits else {}
+    if patterns:
+        condition[field] = {"$all": patterns}
+    return condition
+
+async def backfill_skill_masks():
+    """Compute skills_mask for jobs and profiles stored before the bitmask existed"""
+    for collection, field in ((db.jobs, "skills_required"), (db.profiles, "skills")):
+        async for doc in collection.find({"skills_mask": {"$exists": False}}, {"_id": 1, field: 1}):
+            mask = await skills_mask(doc.get(field) or [])
+            await collection.update_one({"_id": doc["_id"]}, {"$set": {"skills_mask": mask_to_bson(mask)}})
+
+# ==================== RECOMMENDATION HELPERS ====================
+
+# Relative weight of each signal in the recommended jobs ranking
+RECOMMEND_WEIGHTS = {"skills": 0.5, "distance": 0.25, "rate": 0.15, "recency": 0.1}
+RECOMMEND_DISTANCE_SCALE_KM = 10.0  # distance score halves roughly every 7 km
+RECOMMEND_RECENCY_HALF_LIFE_HOURS = 72.0
+EARTH_RADIUS_KM = 6371.0088
+
+# Fields needed to score a candidate job
+RECOMMEND_CANDIDATE_PROJECTION = {
+    "_id": 0,
+    "job_id": 1,
+    "category": 1,
+    "skills_required": 1,
+    "hourly_rate": 1,
+    "created_at": 1,
+    "location": 1
+}
+
+def haversine_km(lat: float, lng: float, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    """Great-circle distance from one point to many"""
+    lat1, lng1 = np.radians(lat), np.radians(lng)
+    lat2, lng2 = np.radians(lats), np.radians(lngs)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k best scores, best first, without sorting everything"""
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    best = np.argpartition(-scores, k)[:k]
+    return best[np.argsort(-scores[best], kind="stable")]
+
+class JobFeatures:
+    """Columnar snapshot of open jobs so ranking is pure array arithmetic"""
+
+    def __init__(self, jobs: List[Dict[str, Any]]):
+        n = len(jobs)
+        self.size = n
+        self.job_ids = [job["job_id"] for job in jobs]
+        self.categories = np.array([job.get("category") or "" for job in jobs], dtype=object)
+        self.rates = np.fromiter((job.get("hourly_rate") or 0.0 for job in jobs), dtype=np.float64, count=n)
+        self.created = np.fromiter(
+            (job["created_at"].replace(tzinfo=timezone.utc).timestamp() for job in jobs),
+            dtype=np.float64,
+            count=n
+        )
+        self.lats = np.fromiter(((job.get("location") or {}).get("lat", 0.0) for job in jobs), dtype=np.float64, count=n)
+        self.lngs = np.fromiter(((job.get("location") or {}).get("lng", 0.0) for job in jobs), dtype=np.float64, count=n)
+        
+        # Normalized required skills: registered ones as a multi-hot matrix (jobs x skills
+        # with a bit, so it stays as small as the registry), free-text ones as job rows per skill
+        self.columns: Dict[str, int] = {}
+        free_text: Dict[str, List[int]] = {}
+        rows, cols = [], []
+        self.required_count = np.zeros(n, dtype=np.float64)
+        for row, job in enumerate(jobs):
+            required = skill_set(job.get("skills_required"))
+            self.required_count[row] = len(required)
+            for skill in required:
+                if skill in skill_bits:
+                    rows.append(row)
+                    cols.append(self.columns.setdefault(skill, len(self.columns)))
+                else:
+                    free_text.setdefault(skill, []).append(row)
+        self.required = np.zeros((n, max(len(self.columns), 1)), dtype=np.float32)
+        if rows:
+            self.required[rows, cols] = 1.0
+        self.free_text = {skill: np.array(job_rows) for skill, job_rows in free_text.items()}
+        self.built_at = time.monotonic()
+
+    def skill_match(self, worker_skills: Optional[List[str]]) -> np.ndarray:
+        """skill_match_score (what apply_to_job stores) for every job"""
+        worker = np.zeros(self.required.shape[1], dtype=np.float32)
+        skills = skill_set(worker_skills)
+        worker[[self.columns[skill] for skill in skills if skill in self.columns]] = 1.0
+        overlap = (self.required @ worker).astype(np.float64)
+        for skill in skills:
+            if skill in self.free_text:
+                overlap[self.free_text[skill]] += 1
+        return np.where(self.required_count > 0, overlap / np.maximum(self.required_count, 1) * 100, 50.0)
+
+    def rank(
+        self,
+        profile: Dict[str, Any],
+        now: datetime,
+        k: int,
+        category: Optional[str] = None,
+        radius_km: Optional[float] = None
+    ) -> tuple:
+        """Best k jobs for a worker; returns (indices, scores, skill match, distances or None)"""
+        mask = np.ones(self.size, dtype=bool)
+        if category:
+            mask &= self.categories == category
+        
+        skills = self.skill_match(profile.get("skills", []))
+        
+        rate_min, rate_max = self.rates.min(), self.rates.max()
+        rate_score = (self.rates - rate_min) / (rate_max - rate_min) if rate_max > rate_min else np.ones(self.size)
+        
+        age_hours = np.maximum(now.timestamp() - self.created, 0) / 3600
+        recency_score = np.exp2(-age_hours / RECOMMEND_RECENCY_HALF_LIFE_HOURS)
+        
+        weights = dict(RECOMMEND_WEIGHTS)
+        distances = None
+        location = profile.get("location") or {}
+        if location.get("lat") is not None and location.get("lng") is not None:
+            distances = haversine_km(location["lat"], location["lng"], self.lats, self.lngs)
+            distance_score = np.exp(-distances / RECOMMEND_DISTANCE_SCALE_KM)
+            if radius_km is not None:
+                mask &= distances <= radius_km
+        else:
+            # Without a worker location distance cannot discriminate between jobs
+            distance_score = np.zeros(self.size)
+            weights["distance"] = 0.0
+        
+        scores = (
+            weights["skills"] * skills / 100
+            + weights["distance"] * distance_score
+            + weights["rate"] * rate_score
+            + weights["recency"] * recency_score
+        ) / sum(weights.values())
+        scores = np.where(mask, scores, -np.inf)
+        
+        best = top_k(scores, min(k, int(mask.sum())))
+        return best, scores, skills, distances
+
+# Shared snapshot, rebuilt when stale; writes that open or close jobs mark it dirty
+job_features = {"snapshot": None, "dirty": True}
+job_features_lock = asyncio.Lock()
+
+def mark_job_features_dirty():
+    job_features["dirty"] = True
+
+async def get_job_features() -> JobFeatures:
+    """Current open-jobs snapshot, rebuilt at most every RECOMMEND_MIN_REBUILD_SECONDS"""
+    snapshot = job_features["snapshot"]
+    if snapshot is not None:
+        age = time.monotonic() - snapshot.built_at
+        fresh = age < RECOMMEND_REFRESH_SECONDS and not job_features["dirty"]
+        if fresh or age < RECOMMEND_MIN_REBUILD_SECONDS:
+            return snapshot
+    
+    async with job_features_lock:
+        # Another request may have rebuilt it while we waited
+        if job_features["snapshot"] is not snapshot:
+            return job_features["snapshot"]
+        job_features["dirty"] = False
+        jobs = await db.jobs.find({"status": "open"}, RECOMMEND_CANDIDATE_PROJECTION).sort(
+            [("created_at", -1), ("job_id", -1)]
+        ).to_list(RECOMMEND_MAX_CANDIDATES)
+        job_features["snapshot"] = await run_in_threadpool(JobFeatures, jobs)
+        return job_features["snapshot"]
+
+# ==================== WORKER SEARCH HELPERS ====================
+
+# Relative weight of each signal when ranking workers for a business
+WORKER_SEARCH_WEIGHTS = {"distance": 0.4, "rating": 0.4, "prestige": 0.2}
+WORKER_SEARCH_DISTANCE_SCALE_KM = 5.0
+WORKER_SEARCH_PRESTIGE_CAP = 200  # 20 completed jobs
+# Only the nearest matching workers are ranked, which keeps dense metros fast
+WORKER_SEARCH_CANDIDATES = int(os.environ.get('WORKER_SEARCH_CANDIDATES', '1000'))
+
+def worker_search_score_expr() -> Dict[str, Any]:
+    """Aggregation expression blending distance, rating and prestige into a 0..1 score"""
+    weights = WORKER_SEARCH_WEIGHTS
+    distance = {"$exp": {"$divide": [{"$multiply": [-1, "$distance_m"]}, WORKER_SEARCH_DISTANCE_SCALE_KM * 1000]}}
+    rating = {"$divide": [{"$ifNull": ["$rating", 0]}, 5]}
+    prestige = {"$min": [1, {"$divide": [{"$ifNull": ["$prestige_score", 0]}, WORKER_SEARCH_PRESTIGE_CAP]}]}
+    return {"$add": [
+        {"$multiply": [weights["distance"], distance]},
+        {"$multiply": [weights["rating"], rating]},
+        {"$multiply": [weights["prestige"], prestige]}
+    ]}
+
+# ==================== DATABASE INDEXES ====================
+
+# Every index a handler relies on, per collection
+INDEXES = {
+    "users": [
+        IndexModel([("user_id", 1)], unique=True),
+        IndexModel([("email", 1)], unique=True),
+    ],
+    "user_sessions": [
+        IndexModel([("session_token", 1)], unique=True),
+        IndexModel([("user_id", 1)]),
+        # Mongo deletes sessions once expires_at has passed
+        IndexModel([("expires_at", 1)], expireAfterSeconds=0),
+    ],
+    "profiles": [
+        IndexModel([("user_id", 1)], unique=True),
+        IndexModel([("geo", "2dsphere"), ("role", 1), ("rating", 1)], name="profiles_geo_role_rating"),
+    ],
+    "skill_registry": [
+        IndexModel([("skill", 1)], unique=True),
+        IndexModel([("bit", 1)], unique=True),
+    ],
+    "jobs": [
+        IndexModel([("job_id", 1)], unique=True),
+        IndexModel([("geo", "2dsphere"), ("status", 1), ("category", 1)], name="jobs_geo_status_category"),
+        IndexModel([("status", 1), ("created_at", -1), ("job_id", -1)]),
+        IndexModel([("status", 1), ("category", 1), ("created_at", -1), ("job_id", -1)]),
+        # Skill filters are evaluated on index keys of open jobs, without fetching documents
+        IndexModel([("status", 1), ("skills_mask", 1)]),
+        IndexModel([("business_user_id", 1), ("created_at", -1), ("job_id", -1)]),
+    ],
+    "applications": [
+        IndexModel([("application_id", 1)], unique=True),
+        # Backs the duplicate-apply check in apply_to_job
+        IndexModel([("job_id", 1), ("worker_user_id", 1)], unique=True),
+        IndexModel([("job_id", 1), ("match_score", -1), ("created_at", 1)]),
+        IndexModel([("worker_user_id", 1), ("created_at", -1), ("application_id", -1)]),
+    ],
+    "reviews": [
+        IndexModel([("review_id", 1)], unique=True),
+        # Backs the duplicate-review check in create_review
+        IndexModel([("job_id", 1), ("reviewer_user_id", 1)], unique=True),
+        IndexModel([("reviewed_user_id", 1), ("created_at", -1), ("review_id", -1)]),
+    ],
+    "chat_rooms": [
+        IndexModel([("room_id", 1)], unique=True),
+        IndexModel([("participants", 1), ("last_message_time", -1), ("room_id", -1)]),
+    ],
+    "task_outbox": [
+        IndexModel([("task_id", 1)], unique=True),
+        IndexModel([("status", 1), ("available_at", 1)]),
+        IndexModel([("status", 1), ("locked_until", 1)]),
+        # Finished tasks are kept for inspection, then expired by Mongo
+        IndexModel([("completed_at", 1)], expireAfterSeconds=TASK_RETENTION_SECONDS),
+    ],
+    "chat_messages": [
+        IndexModel([("message_id", 1)], unique=True),
+        IndexModel([("chat_room_id", 1), ("created_at", 1), ("message_id", 1)]),
+    ],
+}
+
+def index_key(key) -> tuple:
+    """Normalize an index key pattern so shell- and driver-created indexes compare equal"""
+    return tuple((field, int(kind) if isinstance(kind, (int, float)) else kind) for field, kind in key)
+
+def index_options(spec: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "unique": bool(spec.get("unique", False)),
+        "sparse": bool(spec.get("sparse", False)),
+        "expireAfterSeconds": spec.get("expireAfterSeconds")
+    }
+
+async def ensure_indexes(create: bool = True) -> Dict[str, Dict[str, List[str]]]:
+    """Create missing declared indexes and report drift against the live database"""
+    report = {}
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        existing_by_key = {index_key(info["key"]): (name, info) for name, info in existing.items()}
+        drift = {"created": [], "missing": [], "conflicting": [], "undeclared": []}
+        
+        declared_keys = set()
+        for model in models:
+            spec = model.document
+            key = index_key(spec["key"].items())
+            declared_keys.add(key)
+            if key in existing_by_key:
+                name, info = existing_by_key[key]
+                if index_options(info) != index_options(spec):
+                    drift["conflicting"].append(name)
+                continue
+            if not create:
+                drift["missing"].append(spec["name"])
+                continue
+            try:
+                await collection.create_indexes([model])
+                drift["created"].append(spec["name"])
+            except OperationFailure as e:
+                # e.g. duplicate data preventing a unique index
+                logger.error(f"Could not create index {collection_name}.{spec['name']}: {e}")
+                drift["conflicting"].append(spec["name"])
+        
+        for name, info in existing.items():
+            if name != "_id_" and index_key(info["key"]) not in declared_keys:
+                drift["undeclared"].append(name)
+        
+        drift = {kind: names for kind, names in drift.items() if names}
+        if drift:
+            report[collection_name] = drift
+    return report
+
+def log_index_report(report: Dict[str, Dict[str, List[str]]]):
+    for collection_name, drift in report.items():
+        for kind, names in drift.items():
+            level = logging.INFO if kind == "created" else logging.WARNING
+            logger.log(level, f"Index drift on {collection_name}: {kind} {', '.join(names)}")
+
+async def run_migrations(check_only: bool = False) -> Dict[str, Dict[str, List[str]]]:
+    """Bring the database in line with what the handlers expect"""
+    report = await ensure_indexes(create=not check_only)
+    if not check_only:
+        await backfill_geo_points()
+        await load_skill_registry()
+        await backfill_skill_masks()
+        await migrate_inline_profile_images()
+    return report
+
+# ==================== TRANSACTION HELPERS ====================
+
+# Multi-document transactions need a replica set or mongos; detected at startup
+mongo_features = {"transactions": False}
+
+async def detect_transaction_support() -> bool:
+    try:
+        hello = await client.admin.command("hello")
+    except OperationFailure:
+        return False
+    return bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+
+async def run_atomically(operation):
+    """Run operation(session) in a transaction when the deployment supports one"""
+    if not mongo_features["transactions"]:
+        return await operation(None)
+    async with await client.start_session() as session:
+        return await session.with_transaction(operation)
+
+# ==================== BACKGROUND TASKS ====================
+
+# kind -> async handler(payload, session)
+task_handlers = {}
+
+# Keys of the side effects last applied to a profile, kept so a retried task is a no-op
+APPLIED_TASKS_KEPT = 50
+
+class PrimaryWriteMissing(Exception):
+    """The write a task follows up on is not visible (not committed yet, or never made)"""
+
+def task_handler(kind: str):
+    def register(func):
+        task_handlers[kind] = func
+        return func
+    return register
+
+class TaskQueue:
+    """In-process workers draining a durable Mongo outbox of post-write side effects
+
+    Tasks are inserted before the primary write, so a restart never loses them:
+    the in-memory queue only wakes a worker early, and workers poll the outbox
+    for anything due (new, retried, or left running by a crashed process).
+    Handlers check the primary write is there and apply their side effect at
+    most once, since without transactions a task can run more than once.
+    """
+
+    def __init__(self, workers: int):
+        self.worker_count = workers
+        self.wakeups: asyncio.Queue = asyncio.Queue()
+        self.workers: List[asyncio.Task] = []
+        self.stats = {"enqueued": 0, "completed": 0, "retried": 0, "failed": 0}
+
+    async def enqueue(self, kind: str, payload: Dict[str, Any], session=None) -> str:
+        """Persist a task; call notify() with the id once the surrounding write has committed"""
+        if kind not in task_handlers:
+            raise ValueError(f"Unknown task kind: {kind}")
+        now = datetime.now(timezone.utc)
+        task_id = f"task_{uuid.uuid4().hex[:12]}"
+        await db.task_outbox.insert_one({
+            "task_id": task_id,
+            "kind": kind,
+            "payload": payload,
+            "status": "pending",
+            "attempts": 0,
+            "available_at": now,
+            "created_at": now
+        }, session=session)
+        self.stats["enqueued"] += 1
+        return task_id
+
+    async def discard(self, task_id: str):
+        """Drop a task whose primary write failed (only needed without transactions)"""
+        await db.task_outbox.delete_one({"task_id": task_id})
+
+    def notify(self, task_id: Optional[str]):
+        if task_id:
+            self.wakeups.put_nowait(task_id)
+
+    async def claim(self, task_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Lease one due task, or the given one if it is still due"""
+        now = datetime.now(timezone.utc)
+        query = {"$or": [
+            {"status": "pending", "available_at": {"$lte": now}},
+            {"status": "running", "locked_until": {"$lte": now}},
+        ]}
+        if task_id:
+            query["task_id"] = task_id
+        return await db.task_outbox.find_one_and_update(
+            query,
+            {
+                "$set": {"status": "running", "locked_until": now + timedelta(seconds=TASK_LEASE_SECONDS)},
+                "$inc": {"attempts": 1}
+            },
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def run(self, task: Dict[str, Any]):
+        async def finish(session):
+            await task_handlers[task["kind"]](task["payload"], session)
+            await db.task_outbox.update_one(
+                {"task_id": task["task_id"]},
+                {"$set": {"status": "done", "completed_at": datetime.now(timezone.utc)},
+                 "$unset": {"locked_until": ""}},
+                session=session
+            )
+        
+        try:
+            # With transactions the side effect and the done marker commit together;
+            # otherwise a crash in between runs the handler again, which it ignores
+            await run_atomically(finish)
+        except Exception as e:
+            attempts = task["attempts"]
+            if attempts >= TASK_MAX_ATTEMPTS:
+                update = {"status": "failed"}
+                self.stats["failed"] += 1
+                logger.error(f"Task {task['task_id']} ({task['kind']}) failed after {attempts} attempts: {e}")
+            else:
+                delay = TASK_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+                update = {"status": "pending", "available_at": datetime.now(timezone.utc) + timedelta(seconds=delay)}
+                self.stats["retried"] += 1
+                logger.warning(f"Task {task['task_id']} ({task['kind']}) failed, retrying in {delay:.0f}s: {e}")
+            update["last_error"] = str(e)[:500]
+            await db.task_outbox.update_one(
+                {"task_id": task["task_id"]}, {"$set": update, "$unset": {"locked_until": ""}}
+            )
+        else:
+            self.stats["completed"] += 1
+
+    async def worker(self):
+        while True:
+            try:
+                try:
+                    task_id = await asyncio.wait_for(self.wakeups.get(), TASK_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    task_id = None
+                if task_id:
+                    task = await self.claim(task_id)
+                    if task:
+                        await self.run(task)
+                    continue
+                # Idle: sweep the outbox for retries and tasks from before a restart
+                while task := await self.claim():
+                    await self.run(task)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Task worker error: {e}")
+                await asyncio.sleep(TASK_POLL_SECONDS)
+
+    def start(self):
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(self.worker_count)]
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def depth(self) -> Dict[str, int]:
+        """Outbox backlog by status, plus wake-ups not yet picked up"""
+        counts = await db.task_outbox.aggregate([
+            {"$match": {"status": {"$in": ["pending", "running", "failed"]}}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+        ]).to_list(10)
+        depth = {"pending": 0, "running": 0, "failed": 0}
+        depth.update({row["_id"]: row["count"] for row in counts})
+        depth["in_memory"] = self.wakeups.qsize()
+        return depth
+
+task_queue = TaskQueue(TASK_WORKERS)
+
+@task_handler("job_completed")
+async def apply_job_completion(payload: Dict[str, Any], session):
+    """Credit the assigned worker for a completed job, once per job"""
+    job_id = payload["job_id"]
+    if not await db.jobs.find_one({"job_id": job_id, "status": "completed"}, {"_id": 1}, session=session):
+        raise PrimaryWriteMissing(f"Job {job_id} is not completed")
+    # The credit and its key land in one document update, so a rerun matches nothing
+    await db.profiles.update_one(
+        {"user_id": payload["worker_user_id"], "applied_tasks": {"$ne": job_id}},
+        {
+            "$inc": {"completed_jobs": 1, "prestige_score": 10},
+            "$set": {"updated_at": datetime.now(timezone.utc)},
+            "$push": {"applied_tasks": {"$each": [job_id], "$slice": -APPLIED_TASKS_KEPT}}
+        },
+        session=session
+    )
+
+@task_handler("review_created")
+async def apply_review_rating(payload: Dict[str, Any], session):
+    """Fold the rating into the profile counters and award badges in one atomic update, once per review"""
+    review_id = payload["review_id"]
+    if not await db.reviews.find_one({"review_id": review_id}, {"_id": 1}, session=session):
+        raise PrimaryWriteMissing(f"Review {review_id} does not exist")
+    applied = {"$ifNull": ["$applied_tasks", []]}
+    await db.profiles.update_one(
+        {"user_id": payload["reviewed_user_id"], "applied_tasks": {"$ne": review_id}},
+        rating_update_pipeline(payload["rating"]) + [
+            {"$set": {"applied_tasks": {"$slice": [{"$concatArrays": [applied, [review_id]]}, -APPLIED_TASKS_KEPT]}}}
+        ],
+        session=session
+    )
+
 # ==================== AUTH HELPERS ====================
 
 async def get_session_token(request: Request, authorization: Optional[str] = Header(None)) -> Optional[str]:
@@ -195,6 +1695,15 @@ async def get_current_user(request: Request, authorization: Optional[str] = Head
     token = await get_session_token(request, authorization)
     if not token:
         return None
+    return await resolve_session(token)
+
+async def resolve_session(token: str) -> Optional[User]:
+    """Resolve a session token to its user, served from the session cache when possible"""
+    cached_user = session_cache.get(token)
+    if cached_user:
+        return cached_user
+    # A logout or user update racing with this lookup must not be undone by caching its result
+    generation = session_cache.generation
     
     # Find session
     session = await db.user_sessions.find_one({"session_token": token}, {"_id": 0})
@@ -205,13 +1714,16 @@ async def get_current_user(request: Request, authorization: Optional[str] = Head
     expires_at = session["expires_at"]
     if expires_at.tzinfo is None:
         expires_at = expires_at.replace(tzinfo=timezone.utc)
-    if expires_at <= datetime.now(timezone.utc):
+    remaining = (expires_at - datetime.now(timezone.utc)).total_seconds()
+    if remaining <= 0:
         return None
     
     # Get user
     user_doc = await db.users.find_one({"user_id": session["user_id"]}, {"_id": 0})
     if user_doc:
-        return User(**user_doc)
+        user = User(**user_doc)
+        session_cache.set(token, user, ttl_seconds=remaining, generation=generation)
+        return user
     return None
 
 async def require_auth(request: Request, authorization: Optional[str] = Header(None)) -> User:
@@ -221,6 +1733,87 @@ async def require_auth(request: Request, authorization: Optional[str] = Header(N
         raise HTTPException(status_code=401, detail="Not authenticated")
     return user
 
+# ==================== REAL-TIME HELPERS ====================
+
+WS_SEND_TIMEOUT_SECONDS = 5.0
+WS_SEND_QUEUE_SIZE = 100  # events buffered per socket before a slow client is dropped
+
+class ChatHub:
+    """Open chat WebSockets of this process, keyed by user_id.
+    
+    Each socket gets a bounded outbox drained by its own sender task, so
+    publishing never waits on a client and events keep their order.
+    """
+
+    def __init__(self):
+        self.connections: Dict[str, Dict[WebSocket, str]] = {}
+        self.outboxes: Dict[WebSocket, asyncio.Queue] = {}
+        self.senders: Dict[WebSocket, asyncio.Task] = {}
+        self.closing: Set[asyncio.Task] = set()
+
+    def connect(self, user_id: str, websocket: WebSocket, token: str):
+        self.connections.setdefault(user_id, {})[websocket] = token
+        outbox = asyncio.Queue(WS_SEND_QUEUE_SIZE)
+        self.outboxes[websocket] = outbox
+        self.senders[websocket] = asyncio.create_task(self._sender(user_id, websocket, outbox))
+
+    def disconnect(self, user_id: str, websocket: WebSocket):
+        sockets = self.connections.get(user_id)
+        if sockets is not None:
+            sockets.pop(websocket, None)
+            if not sockets:
+                del self.connections[user_id]
+        self.outboxes.pop(websocket, None)
+        sender = self.senders.pop(websocket, None)
+        if sender is not None and sender is not asyncio.current_task():
+            sender.cancel()
+
+    async def _close(self, websocket: WebSocket, code: int):
+        try:
+            await asyncio.wait_for(websocket.close(code=code), WS_SEND_TIMEOUT_SECONDS)
+        except Exception:
+            pass
+
+    def _drop(self, user_id: str, websocket: WebSocket):
+        """Unregister a dead or stalled client and close its socket in the background.
+        
+        The app resyncs over HTTP when it reconnects.
+        """
+        self.disconnect(user_id, websocket)
+        task = asyncio.create_task(self._close(websocket, WS_1011_INTERNAL_ERROR))
+        self.closing.add(task)
+        task.add_done_callback(self.closing.discard)
+
+    async def _sender(self, user_id: str, websocket: WebSocket, outbox: asyncio.Queue):
+        """Write one socket's queued events in order"""
+        while True:
+            event = await outbox.get()
+            try:
+                await asyncio.wait_for(websocket.send_json(event), WS_SEND_TIMEOUT_SECONDS)
+            except Exception:
+                self._drop(user_id, websocket)
+                return
+
+    def publish(self, user_ids: List[str], event: Dict[str, Any]):
+        """Queue an event for every open socket of the given users"""
+        for user_id in user_ids:
+            for websocket in list(self.connections.get(user_id, {})):
+                try:
+                    self.outboxes[websocket].put_nowait(event)
+                except asyncio.QueueFull:
+                    logger.warning(f"Chat socket of {user_id} is {WS_SEND_QUEUE_SIZE} events behind, dropping it")
+                    self._drop(user_id, websocket)
+
+    async def close_session(self, token: str):
+        """Close the sockets opened with a session that just logged out"""
+        for user_id, sockets in list(self.connections.items()):
+            for websocket, socket_token in list(sockets.items()):
+                if socket_token == token:
+                    self.disconnect(user_id, websocket)
+                    await self._close(websocket, WS_1008_POLICY_VIOLATION)
+
+chat_hub = ChatHub()
+
 # ==================== AUTH ENDPOINTS ====================
 
 @api_router.post("/auth/session")
@@ -264,7 +1857,12 @@ async def exchange_session(request: Request, response: Response):
             "onboarding_completed": False,
             "created_at": datetime.now(timezone.utc)
         }
-        await db.users.insert_one(new_user)
+        try:
+            await db.users.insert_one(new_user)
+        except DuplicateKeyError:
+            # A concurrent login created the user first (unique email index)
+            existing_user = await db.users.find_one({"email": user_data["email"]}, {"_id": 0})
+            user_id = existing_user["user_id"]
     
     # Create session
     session_token = user_data["session_token"]
@@ -272,6 +1870,7 @@ async def exchange_session(request: Request, response: Response):
     
     # Delete old sessions for this user
     await db.user_sessions.delete_many({"user_id": user_id})
+    invalidate_user_sessions(user_id)
     
     # Store new session
     await db.user_sessions.insert_one({
@@ -301,21 +1900,29 @@ async def exchange_session(request: Request, response: Response):
     }
 
 @api_router.get("/auth/me")
-async def get_me(current_user: User = Depends(require_auth)):
-    """Get current user info"""
+async def get_me(
+    request: Request,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    view: Optional[str] = Query(None, description="Named field set, e.g. card or summary"),
+    current_user: User = Depends(require_auth)
+):
+    """Get current user info (fields/view narrow the profile)"""
     # Also get profile if exists
-    profile = await db.profiles.find_one({"user_id": current_user.user_id}, {"_id": 0})
+    projection = field_projection("profile", fields, view)
+    profile = await db.profiles.find_one({"user_id": current_user.user_id}, projection or PROFILE_PUBLIC_PROJECTION)
     return {
         "user": current_user.model_dump(),
-        "profile": profile
+        "profile": with_media_urls(profile, request)
     }
 
 @api_router.post("/auth/logout")
-async def logout(request: Request, response: Response):
+async def logout(request: Request, response: Response, authorization: Optional[str] = Header(None)):
     """Logout user"""
-    token = await get_session_token(request)
+    token = await get_session_token(request, authorization)
     if token:
         await db.user_sessions.delete_many({"session_token": token})
+        session_cache.pop(token)
+        await chat_hub.close_session(token)
     
     response.delete_cookie(key="session_token", path="/")
     return {"message": "Logged out successfully"}
@@ -332,19 +1939,22 @@ async def set_user_role(data: SetRoleRequest, current_user: User = Depends(requi
         {"user_id": current_user.user_id},
         {"$set": {"role": data.role}}
     )
+    invalidate_user_sessions(current_user.user_id)
     
     return {"message": "Role set successfully", "role": data.role}
 
 @api_router.post("/onboarding/worker")
-async def complete_worker_onboarding(data: OnboardingWorkerRequest, current_user: User = Depends(require_auth)):
+async def complete_worker_onboarding(data: OnboardingWorkerRequest, request: Request, current_user: User = Depends(require_auth)):
     """Complete worker onboarding"""
+    photo, photo_thumb = await store_image(data.photo)
     profile_data = {
         "user_id": current_user.user_id,
         "role": "worker",
         "name": data.name,
         "age": data.age,
         "bio": data.bio,
-        "photo": data.photo,
+        "photo": photo,
+        "photo_thumb": photo_thumb,
         "skills": data.skills,
         "location": data.location,
         "address": data.address,
@@ -353,14 +1963,17 @@ async def complete_worker_onboarding(data: OnboardingWorkerRequest, current_user
         "completed_jobs": 0,
         "rating": 0.0,
         "rating_count": 0,
+        "rating_sum": 0,
+        "rating_histogram": {},
         "created_at": datetime.now(timezone.utc),
         "updated_at": datetime.now(timezone.utc)
     }
     
     # Upsert profile
+    internal = {"skills_mask": mask_to_bson(await skills_mask(data.skills)), "geo": geo_point(data.location)}
     await db.profiles.update_one(
         {"user_id": current_user.user_id},
-        {"$set": profile_data},
+        {"$set": {**profile_data, **internal}},
         upsert=True
     )
     
@@ -369,33 +1982,40 @@ async def complete_worker_onboarding(data: OnboardingWorkerRequest, current_user
         {"user_id": current_user.user_id},
         {"$set": {"onboarding_completed": True, "role": "worker"}}
     )
+    invalidate_user_sessions(current_user.user_id)
     
-    return {"message": "Onboarding completed", "profile": profile_data}
+    return {"message": "Onboarding completed", "profile": with_media_urls(dict(profile_data), request)}
 
 @api_router.post("/onboarding/business")
-async def complete_business_onboarding(data: OnboardingBusinessRequest, current_user: User = Depends(require_auth)):
+async def complete_business_onboarding(data: OnboardingBusinessRequest, request: Request, current_user: User = Depends(require_auth)):
     """Complete business onboarding"""
+    photo, photo_thumb = await store_image(data.photo)
+    business_photos = await store_images(data.business_photos)
     profile_data = {
         "user_id": current_user.user_id,
         "role": "business",
         "name": data.name,
         "bio": data.bio,
-        "photo": data.photo,
+        "photo": photo,
+        "photo_thumb": photo_thumb,
         "business_name": data.business_name,
-        "business_photos": data.business_photos,
+        "business_photos": business_photos,
         "location": data.location,
         "address": data.address,
         "skills": data.skills,  # Categories they hire for
         "rating": 0.0,
         "rating_count": 0,
+        "rating_sum": 0,
+        "rating_histogram": {},
         "created_at": datetime.now(timezone.utc),
         "updated_at": datetime.now(timezone.utc)
     }
     
     # Upsert profile
+    internal = {"skills_mask": mask_to_bson(await skills_mask(data.skills)), "geo": geo_point(data.location)}
     await db.profiles.update_one(
         {"user_id": current_user.user_id},
-        {"$set": profile_data},
+        {"$set": {**profile_data, **internal}},
         upsert=True
     )
     
@@ -404,132 +2024,412 @@ async def complete_business_onboarding(data: OnboardingBusinessRequest, current_
         {"user_id": current_user.user_id},
         {"$set": {"onboarding_completed": True, "role": "business"}}
     )
+    invalidate_user_sessions(current_user.user_id)
     
-    return {"message": "Onboarding completed", "profile": profile_data}
+    return {"message": "Onboarding completed", "profile": with_media_urls(dict(profile_data), request)}
 
 @api_router.get("/profile")
-async def get_profile(current_user: User = Depends(require_auth)):
+async def get_profile(request: Request, current_user: User = Depends(require_auth)):
     """Get current user's profile"""
-    profile = await db.profiles.find_one({"user_id": current_user.user_id}, {"_id": 0})
+    profile = await db.profiles.find_one({"user_id": current_user.user_id}, PROFILE_PUBLIC_PROJECTION)
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
-    return profile
+    return with_media_urls(profile, request)
 
 @api_router.get("/profile/{user_id}")
-async def get_user_profile(user_id: str):
+async def get_user_profile(
+    user_id: str,
+    request: Request,
+    response: Response,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    view: Optional[str] = Query(None, description="Named field set, e.g. card or summary"),
+):
     """Get a user's profile by ID"""
-    profile = await db.profiles.find_one({"user_id": user_id}, {"_id": 0})
+    projection = field_projection("profile", fields, view)
+    profile = await db.profiles.find_one({"user_id": user_id}, projection or PROFILE_PUBLIC_PROJECTION)
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
-    return profile
+    return conditional_response(request, response, with_media_urls(profile, request), DOCUMENT_CACHE_CONTROL)
 
-# ==================== AI ENDPOINTS ====================
+# ==================== MEDIA ENDPOINTS ====================
 
-@api_router.post("/ai/improve-description")
-async def improve_description(data: ImproveDescriptionRequest, current_user: User = Depends(require_auth)):
-    """Use Z.ai GLM to improve profile/job description"""
-    
-    if data.context == "profile":
-        system_prompt = """You are an expert copywriter for a gig-work marketplace called NomadShift. 
+@api_router.get("/media/{media_hash}")
+async def get_media(media_hash: str, request: Request, variant: Optional[str] = None):
+    """Serve a stored image (variant=thumb for the thumbnail)"""
+    file_doc = await db["media.files"].find_one({"_id": media_hash}, {"metadata": 1})
+    if not file_doc:
+        raise HTTPException(status_code=404, detail="Media not found")
+    metadata = file_doc.get("metadata") or {}
+    if variant == "thumb" and metadata.get("thumbnail"):
+        media_hash = metadata["thumbnail"]
+        file_doc = await db["media.files"].find_one({"_id": media_hash}, {"metadata": 1})
+        if not file_doc:
+            raise HTTPException(status_code=404, detail="Media not found")
+        metadata = file_doc.get("metadata") or {}
+    
+    # Content addressed: a hash never changes meaning, so it can be cached forever
+    headers = {
+        "ETag": f'"{media_hash}"',
+        "Cache-Control": "public, max-age=31536000, immutable"
+    }
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    
+    stream = await media_bucket.open_download_stream(media_hash)
+    content = await stream.read()
+    return Response(
+        content=content,
+        media_type=metadata.get("content_type", "application/octet-stream"),
+        headers=headers
+    )
+
+# ==================== AI HELPERS ====================
+
+IMPROVE_PROMPTS = {
+    "profile": """You are an expert copywriter for a gig-work marketplace called NomadShift. 
 Improve this profile description to be attractive, professional, and concise. 
 Make it engaging and highlight the person's strengths. 
 Keep it under 150 words. Write in Spanish if the input is in Spanish, otherwise in English.
-Only return the improved description, no explanations."""
-    else:
-        system_prompt = """You are an expert copywriter for a gig-work marketplace called NomadShift. 
+Only return the improved description, no explanations.""",
+    "job": """You are an expert copywriter for a gig-work marketplace called NomadShift. 
 Improve this job description to be clear, professional, and attractive to potential workers. 
 Highlight key requirements and benefits. 
 Keep it under 200 words. Write in Spanish if the input is in Spanish, otherwise in English.
 Only return the improved description, no explanations."""
-    
-    # Fallback improvement function
-    def generate_fallback_improvement(text: str, context: str) -> str:
-        """Generate a basic improvement when AI API is unavailable"""
-        text = text.strip()
-        if not text:
-            return text
-        
-        # Add professional opening and closing based on context
-        if context == "profile":
-            # Detect Spanish
-            is_spanish = any(word in text.lower() for word in ['soy', 'tengo', 'experiencia', 'trabajo', 'años'])
-            if is_spanish:
-                improved = f"Profesional comprometido y confiable. {text}"
-                if not text.endswith('.'):
-                    improved += "."
-                improved += " Disponible para trabajar de inmediato y con excelente actitud de servicio."
-            else:
-                improved = f"Dedicated and reliable professional. {text}"
-                if not text.endswith('.'):
-                    improved += "."
-                improved += " Available immediately with excellent work ethic."
+}
+
+# Long-lived pooled client so calls reuse keep-alive connections to Z.ai
+zai_client: Optional[httpx.AsyncClient] = None
+
+# (context, normalized description) -> improved text
+ai_cache = TTLCache(AI_CACHE_MAX_ENTRIES, AI_CACHE_TTL_SECONDS)
+
+# In-flight upstream calls shared by identical concurrent requests
+ai_inflight: Dict[Any, asyncio.Future] = {}
+
+class UpstreamUnavailable(Exception):
+    """The upstream was not called (circuit open or no free slot)"""
+
+class CircuitBreaker:
+    """Stop calling a failing upstream, then let a single probe through after a cool-down"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.times_opened = 0
+
+    def _transition(self, state: str):
+        if state != self.state:
+            logger.warning(f"Circuit {self.name}: {self.state} -> {state}")
+            self.state = state
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self._transition(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            if self.probe_in_flight:
+                return False
+            self.probe_in_flight = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.probe_in_flight = False
+        self._transition(self.CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        self.probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+            self._transition(self.OPEN)
+
+    def abandon(self):
+        """A permitted call ended without a verdict (cancelled, never sent)"""
+        self.probe_in_flight = False
+
+zai_breaker = CircuitBreaker("zai", ZAI_BREAKER_FAILURES, ZAI_BREAKER_RESET_SECONDS)
+zai_semaphore = asyncio.Semaphore(ZAI_MAX_CONCURRENCY)
+
+# Counters for the improvement endpoint; fallback rate = fallbacks / requests
+ai_stats = {
+    "requests": 0,
+    "fallbacks": 0,
+    "upstream_calls": 0,
+    "upstream_failures": 0,
+    "breaker_rejections": 0,
+    "queue_timeouts": 0
+}
+ai_gauges = {"in_flight": 0}
+
+@asynccontextmanager
+async def zai_call_slot():
+    """Admit one upstream call: fail fast while the circuit is open or the queue is full"""
+    if not zai_breaker.allow():
+        ai_stats["breaker_rejections"] += 1
+        raise UpstreamUnavailable("circuit open")
+    try:
+        await asyncio.wait_for(zai_semaphore.acquire(), ZAI_QUEUE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        zai_breaker.abandon()
+        ai_stats["queue_timeouts"] += 1
+        raise UpstreamUnavailable("no free upstream slot")
+    
+    ai_stats["upstream_calls"] += 1
+    ai_gauges["in_flight"] += 1
+    try:
+        yield
+    except Exception:
+        ai_stats["upstream_failures"] += 1
+        zai_breaker.record_failure()
+        raise
+    except BaseException:
+        zai_breaker.abandon()
+        raise
+    else:
+        zai_breaker.record_success()
+    finally:
+        ai_gauges["in_flight"] -= 1
+        zai_semaphore.release()
+
+def get_zai_client() -> httpx.AsyncClient:
+    global zai_client
+    if zai_client is None or zai_client.is_closed:
+        zai_client = httpx.AsyncClient(
+            timeout=ZAI_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=ZAI_MAX_CONNECTIONS,
+                max_keepalive_connections=ZAI_MAX_CONNECTIONS,
+                keepalive_expiry=60.0
+            ),
+            headers={"Authorization": f"Bearer {ZAI_API_KEY}"}
+        )
+    return zai_client
+
+async def close_zai_client():
+    if zai_client is not None:
+        await zai_client.aclose()
+
+def generate_fallback_improvement(text: str, context: str) -> str:
+    """Generate a basic improvement when AI API is unavailable"""
+    text = text.strip()
+    if not text:
+        return text
+    
+    # Add professional opening and closing based on context
+    if context == "profile":
+        # Detect Spanish
+        is_spanish = any(word in text.lower() for word in ['soy', 'tengo', 'experiencia', 'trabajo', 'años'])
+        if is_spanish:
+            improved = f"Profesional comprometido y confiable. {text}"
+            if not text.endswith('.'):
+                improved += "."
+            improved += " Disponible para trabajar de inmediato y con excelente actitud de servicio."
         else:
-            is_spanish = any(word in text.lower() for word in ['buscamos', 'necesitamos', 'trabajo', 'horario'])
-            if is_spanish:
-                improved = f"¡Oportunidad laboral! {text}"
-                if not text.endswith('.'):
-                    improved += "."
-                improved += " Ambiente de trabajo agradable y pago competitivo."
-            else:
-                improved = f"Great opportunity! {text}"
-                if not text.endswith('.'):
-                    improved += "."
-                improved += " Friendly work environment and competitive pay."
-        
-        return improved
+            improved = f"Dedicated and reliable professional. {text}"
+            if not text.endswith('.'):
+                improved += "."
+            improved += " Available immediately with excellent work ethic."
+    else:
+        is_spanish = any(word in text.lower() for word in ['buscamos', 'necesitamos', 'trabajo', 'horario'])
+        if is_spanish:
+            improved = f"¡Oportunidad laboral! {text}"
+            if not text.endswith('.'):
+                improved += "."
+            improved += " Ambiente de trabajo agradable y pago competitivo."
+        else:
+            improved = f"Great opportunity! {text}"
+            if not text.endswith('.'):
+                improved += "."
+            improved += " Friendly work environment and competitive pay."
     
+    return improved
+
+def improvement_key(description: str, context: str) -> tuple:
+    """Cache key: whitespace differences do not change the improvement"""
+    return (context, " ".join(description.split()))
+
+async def single_flight(key: Any, factory):
+    """Run factory() once per key; concurrent callers await the same result"""
+    task = ai_inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        ai_inflight[key] = task
+        task.add_done_callback(lambda _: ai_inflight.pop(key, None))
+    # Shielded so one caller disconnecting does not cancel the others' call
+    return await asyncio.shield(task)
+
+def improvement_payload(description: str, context: str, stream: bool = False) -> Dict[str, Any]:
+    """Chat-completions request body for a description improvement"""
+    payload = {
+        "model": "glm-4.5",
+        "messages": [
+            {"role": "system", "content": IMPROVE_PROMPTS[context]},
+            {"role": "user", "content": description}
+        ],
+        "temperature": 0.7,
+        "max_tokens": 500
+    }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+async def request_improvement(description: str, context: str) -> Optional[str]:
+    """Call Z.ai GLM; returns None when the upstream fails so callers can fall back"""
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
+        async with zai_call_slot():
+            response = await get_zai_client().post(
                 ZAI_API_URL,
-                headers={
-                    "Authorization": f"Bearer {ZAI_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "glm-4.5",
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": data.description}
-                    ],
-                    "temperature": 0.7,
-                    "max_tokens": 500
-                }
+                json=improvement_payload(description, context)
             )
-            
-            if response.status_code != 200:
-                logger.warning(f"Z.ai API error: {response.status_code} - using fallback")
-                # Use fallback improvement
-                improved_text = generate_fallback_improvement(data.description, data.context)
-                return {
-                    "original": data.description,
-                    "improved": improved_text,
-                    "fallback": True
-                }
-            
+            response.raise_for_status()
             result = response.json()
-            improved_text = result["choices"][0]["message"]["content"]
-            
-            return {
-                "original": data.description,
-                "improved": improved_text.strip()
-            }
+            return result["choices"][0]["message"]["content"].strip()
+    except UpstreamUnavailable as e:
+        logger.info(f"Z.ai skipped: {e} - using fallback")
+        return None
+    except httpx.HTTPStatusError as e:
+        logger.warning(f"Z.ai API error: {e.response.status_code} - using fallback")
+        return None
     except httpx.TimeoutException:
         logger.warning("Z.ai API timeout - using fallback")
-        improved_text = generate_fallback_improvement(data.description, data.context)
-        return {
-            "original": data.description,
-            "improved": improved_text,
-            "fallback": True
-        }
+        return None
     except Exception as e:
         logger.warning(f"AI improvement error: {e} - using fallback")
-        improved_text = generate_fallback_improvement(data.description, data.context)
+        return None
+
+async def improve_text(description: str, context: str) -> Optional[str]:
+    """Cached, deduplicated improvement; None when the upstream is unavailable"""
+    key = improvement_key(description, context)
+    improved = ai_cache.get(key)
+    if improved is not None:
+        return improved
+    
+    async def fetch():
+        text = await request_improvement(description, context)
+        if text:
+            ai_cache.set(key, text)
+        return text
+    
+    return await single_flight(key, fetch)
+
+async def stream_upstream_improvement(description: str, context: str):
+    """Yield content deltas from the Z.ai streaming completion; raises on upstream failure"""
+    async with zai_call_slot(), get_zai_client().stream(
+        "POST",
+        ZAI_API_URL,
+        json=improvement_payload(description, context, stream=True)
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            chunk = line[5:].strip()
+            if chunk == "[DONE]":
+                return
+            delta = json.loads(chunk)["choices"][0].get("delta") or {}
+            # Only the answer is streamed, not the model's reasoning tokens
+            if delta.get("content"):
+                yield delta["content"]
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def improvement_events(description: str, context: str):
+    """Server-Sent Events for a streamed improvement.
+    
+    Emits `delta` events with text fragments and a final `done` event carrying
+    the full result. If the upstream fails mid-stream a `fallback` event tells
+    the client to replace what it has shown with the fallback text.
+    """
+    key = improvement_key(description, context)
+    cached = ai_cache.get(key)
+    if cached is not None:
+        yield sse_event("delta", {"text": cached})
+        yield sse_event("done", {"original": description, "improved": cached})
+        return
+    
+    parts = []
+    try:
+        async for text in stream_upstream_improvement(description, context):
+            parts.append(text)
+            yield sse_event("delta", {"text": text})
+    except Exception as e:
+        logger.warning(f"AI improvement stream error: {e} - using fallback")
+        parts = []
+    
+    improved = "".join(parts).strip()
+    if not improved:
+        ai_stats["fallbacks"] += 1
+        improved = generate_fallback_improvement(description, context)
+        yield sse_event("fallback", {"text": improved})
+        yield sse_event("done", {"original": description, "improved": improved, "fallback": True})
+        return
+    
+    ai_cache.set(key, improved)
+    yield sse_event("done", {"original": description, "improved": improved})
+
+# ==================== AI ENDPOINTS ====================
+
+@api_router.post("/ai/improve-description")
+async def improve_description(
+    data: ImproveDescriptionRequest,
+    stream: bool = False,
+    current_user: User = Depends(require_auth)
+):
+    """Use Z.ai GLM to improve profile/job description (stream=true for Server-Sent Events)"""
+    context = "profile" if data.context == "profile" else "job"
+    ai_stats["requests"] += 1
+    
+    if stream:
+        return StreamingResponse(
+            improvement_events(data.description, context),
+            media_type="text/event-stream",
+            # Keep proxies from buffering the stream
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
+    improved_text = await improve_text(data.description, context)
+    if not improved_text:
+        ai_stats["fallbacks"] += 1
         return {
             "original": data.description,
-            "improved": improved_text,
+            "improved": generate_fallback_improvement(data.description, context),
             "fallback": True
         }
+    
+    return {
+        "original": data.description,
+        "improved": improved_text
+    }
+
+@api_router.get("/ai/status")
+async def ai_status():
+    """Circuit breaker state and fallback counters for the Z.ai upstream"""
+    requests_total = ai_stats["requests"]
+    return {
+        "breaker": {
+            "state": zai_breaker.state,
+            "consecutive_failures": zai_breaker.failures,
+            "times_opened": zai_breaker.times_opened
+        },
+        "in_flight": ai_gauges["in_flight"],
+        "counters": ai_stats,
+        "fallback_rate": round(ai_stats["fallbacks"] / requests_total, 4) if requests_total else 0.0
+    }
 
 # ==================== JOB ENDPOINTS ====================
 
@@ -554,48 +2454,137 @@ async def create_job(data: CreateJobRequest, current_user: User = Depends(requir
         address=data.address
     )
     
-    await db.jobs.insert_one(job.model_dump())
+    geo = geo_point(data.location)
+    if not geo:
+        raise HTTPException(status_code=400, detail="Invalid location")
+    
+    job_doc = job.model_dump()
+    job_doc["geo"] = geo
+    job_doc["skills_mask"] = mask_to_bson(await skills_mask(data.skills_required))
+    await db.jobs.insert_one(job_doc)
+    mark_job_features_dirty()
     return job.model_dump()
 
 @api_router.get("/jobs")
 async def get_jobs(
+    response: Response,
     category: Optional[str] = None,
     lat: Optional[float] = None,
     lng: Optional[float] = None,
-    radius_km: float = 10.0,
-    status: str = "open"
+    radius_km: float = Query(10.0, gt=0),
+    status: str = "open",
+    skills: Optional[List[str]] = Query(None),
+    skills_match: str = Query("all", pattern="^(all|any)$"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    view: Optional[str] = Query(None, description="Named field set, e.g. card or pin"),
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
 ):
-    """Get all jobs with optional filters"""
+    """Get all jobs with optional filters (skills: jobs requiring all/any of them)"""
+    projection = field_projection("job", fields, view)
     query = {"status": status}
     
     if category:
         query["category"] = category
+    skill_condition = await skills_filter(skills or [], "skills_required", skills_match)
+    if skill_condition:
+        query.update(skill_condition)
     
-    jobs = await db.jobs.find(query, {"_id": 0}).sort("created_at", -1).to_list(100)
-    
-    # If location provided, filter by distance
+    # If location provided, search by great-circle distance using the 2dsphere index
     if lat is not None and lng is not None:
-        filtered_jobs = []
+        near = geo_point({"lat": lat, "lng": lng})
+        if not near:
+            raise HTTPException(status_code=400, detail="Invalid coordinates")
+        geo_near = {
+            "near": near,
+            "key": "geo",
+            "distanceField": "distance_m",
+            "maxDistance": radius_km * 1000,
+            "spherical": True,
+            "query": query
+        }
+        pipeline = [{"$geoNear": geo_near}]
+        if cursor:
+            # Seek past the last page by distance, breaking ties on job_id
+            geo_near["minDistance"] = decode_cursor(cursor)[0]
+            pipeline.append({"$match": keyset_filter("distance_m", "job_id", cursor, descending=False)})
+        pipeline += [
+            {"$sort": {"distance_m": 1, "job_id": 1}},
+            {"$limit": limit + 1},
+            {"$project": {**projection, "distance_m": 1} if projection else JOB_PUBLIC_PROJECTION}
+        ]
+        jobs = await db.jobs.aggregate(pipeline).to_list(limit + 1)
+        
+        if len(jobs) > limit:
+            jobs = jobs[:limit]
+            set_next_cursor(response, encode_cursor(jobs[-1]["distance_m"], jobs[-1]["job_id"]))
         for job in jobs:
-            if job.get("location"):
-                job_lat = job["location"].get("lat", 0)
-                job_lng = job["location"].get("lng", 0)
-                # Simple distance calculation (Haversine approximation)
-                distance = ((job_lat - lat)**2 + (job_lng - lng)**2) ** 0.5 * 111  # km
-                if distance <= radius_km:
-                    job["distance_km"] = round(distance, 2)
-                    filtered_jobs.append(job)
-        jobs = sorted(filtered_jobs, key=lambda x: x.get("distance_km", 999))
-    
-    return jobs
+            job["distance_km"] = round(job.pop("distance_m") / 1000, 2)
+        return json_list(jobs, response)
+    
+    jobs, next_cursor = await paginate(
+        db.jobs, query, "created_at", "job_id", cursor, limit,
+        projection=projection or JOB_PUBLIC_PROJECTION
+    )
+    set_next_cursor(response, next_cursor)
+    return json_list(jobs, response)
+
+@api_router.get("/jobs/recommended")
+async def get_recommended_jobs(
+    category: Optional[str] = None,
+    radius_km: float = RECOMMEND_RADIUS_KM,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    view: Optional[str] = Query(None, description="Named field set, e.g. card or pin"),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    current_user: User = Depends(require_auth)
+):
+    """Open jobs ranked for the current worker by skills, distance, pay and recency"""
+    projection = field_projection("job", fields, view)
+    profile = await db.profiles.find_one({"user_id": current_user.user_id}, {"_id": 0})
+    if not profile or profile.get("role") != "worker":
+        raise HTTPException(status_code=403, detail="Only workers have recommendations")
+    
+    features = await get_job_features()
+    if not features.size:
+        return []
+    # Rank a few extra: jobs filled since the snapshot are dropped below
+    best, scores, skill_scores, distances = features.rank(
+        profile, datetime.now(timezone.utc), limit * 2, category=category, radius_km=radius_km
+    )
+    
+    # Same prestige bonus as apply_to_job
+    prestige_bonus = min(profile.get("prestige_score", 0) / 10, 20)
+    ranked = {}
+    for i in best:
+        ranked[features.job_ids[i]] = {
+            "recommendation_score": round(float(scores[i]), 4),
+            "match_score": min(float(skill_scores[i]) + prestige_bonus, 100),
+            **({"distance_km": round(float(distances[i]), 2)} if distances is not None else {})
+        }
+    
+    jobs = await db.jobs.find(
+        {"job_id": {"$in": list(ranked)}, "status": "open"},
+        projection or JOB_PUBLIC_PROJECTION
+    ).to_list(len(ranked) or 1)
+    for job in jobs:
+        job.update(ranked[job["job_id"]])
+    jobs.sort(key=lambda job: job["recommendation_score"], reverse=True)
+    return json_list(jobs[:limit])
 
 @api_router.get("/jobs/{job_id}")
-async def get_job(job_id: str):
+async def get_job(
+    job_id: str,
+    request: Request,
+    response: Response,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    view: Optional[str] = Query(None, description="Named field set, e.g. card or pin"),
+):
     """Get job details"""
-    job = await db.jobs.find_one({"job_id": job_id}, {"_id": 0})
+    projection = field_projection("job", fields, view)
+    job = await db.jobs.find_one({"job_id": job_id}, projection or JOB_PUBLIC_PROJECTION)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
-    return job
+    return conditional_response(request, response, job, DOCUMENT_CACHE_CONTROL)
 
 @api_router.post("/jobs/{job_id}/apply")
 async def apply_to_job(job_id: str, data: ApplyJobRequest, current_user: User = Depends(require_auth)):
@@ -612,21 +2601,8 @@ async def apply_to_job(job_id: str, data: ApplyJobRequest, current_user: User =
     if job["status"] != "open":
         raise HTTPException(status_code=400, detail="Job is no longer accepting applications")
     
-    # Check if already applied
-    existing = await db.applications.find_one({
-        "job_id": job_id,
-        "worker_user_id": current_user.user_id
-    })
-    if existing:
-        raise HTTPException(status_code=400, detail="Already applied to this job")
-    
     # Calculate match score based on skills
-    worker_skills = set(profile.get("skills", []))
-    required_skills = set(job.get("skills_required", []))
-    if required_skills:
-        match_score = len(worker_skills & required_skills) / len(required_skills) * 100
-    else:
-        match_score = 50.0  # Default score if no skills required
+    match_score = skill_match_score(profile.get("skills"), job.get("skills_required"))
     
     # Add prestige bonus
     prestige = profile.get("prestige_score", 0)
@@ -639,71 +2615,98 @@ async def apply_to_job(job_id: str, data: ApplyJobRequest, current_user: User =
         match_score=min(match_score, 100)
     )
     
-    await db.applications.insert_one(application.model_dump())
+    # The unique (job_id, worker_user_id) index rejects duplicate applications
+    try:
+        await db.applications.insert_one(application.model_dump())
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Already applied to this job")
     return application.model_dump()
 
 @api_router.get("/jobs/{job_id}/applications")
-async def get_job_applications(job_id: str, current_user: User = Depends(require_auth)):
+async def get_job_applications(
+    job_id: str,
+    request: Request,
+    worker_fields: Optional[str] = Query(None, description="Comma-separated worker profile fields"),
+    worker_view: str = Query("card", description="Named worker profile field set: card or summary"),
+    current_user: User = Depends(require_auth)
+):
     """Get applications for a job (business owner only)"""
+    worker_projection = field_projection("profile", worker_fields, worker_view) or WORKER_CARD_PROJECTION
     job = await db.jobs.find_one({"job_id": job_id}, {"_id": 0})
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     if job["business_user_id"] != current_user.user_id:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    applications = await db.applications.find({"job_id": job_id}, {"_id": 0}).to_list(100)
-    
-    # Enrich with worker profiles
+    # Best matches first, ordered by the (job_id, match_score) index
+    applications = await db.applications.find({"job_id": job_id}, {"_id": 0}).sort(
+        [("match_score", -1), ("created_at", 1)]
+    ).to_list(100)
+    
+    # Enrich with worker profiles in one round trip
+    worker_ids = list({app["worker_user_id"] for app in applications})
+    profiles = await db.profiles.find(
+        {"user_id": {"$in": worker_ids}},
+        worker_projection
+    ).to_list(100)
+    profiles_by_user = {profile["user_id"]: with_media_urls(profile, request) for profile in profiles}
     for app in applications:
-        profile = await db.profiles.find_one({"user_id": app["worker_user_id"]}, {"_id": 0})
-        app["worker_profile"] = profile
-    
-    # Sort by match score
-    applications.sort(key=lambda x: x.get("match_score", 0), reverse=True)
+        app["worker_profile"] = profiles_by_user.get(app["worker_user_id"])
     
-    return applications
+    return json_list(applications)
 
 @api_router.post("/jobs/{job_id}/accept/{application_id}")
 async def accept_application(job_id: str, application_id: str, current_user: User = Depends(require_auth)):
     """Accept an application and assign worker to job"""
-    job = await db.jobs.find_one({"job_id": job_id}, {"_id": 0})
-    if not job:
-        raise HTTPException(status_code=404, detail="Job not found")
-    if job["business_user_id"] != current_user.user_id:
-        raise HTTPException(status_code=403, detail="Not authorized")
-    
-    application = await db.applications.find_one({"application_id": application_id}, {"_id": 0})
-    if not application:
-        raise HTTPException(status_code=404, detail="Application not found")
-    
-    # Update application status
-    await db.applications.update_one(
-        {"application_id": application_id},
-        {"$set": {"status": "accepted"}}
-    )
-    
-    # Update job
-    await db.jobs.update_one(
-        {"job_id": job_id},
-        {"$set": {
-            "status": "in_progress",
-            "assigned_worker_id": application["worker_user_id"],
-            "start_time": datetime.now(timezone.utc)
-        }}
-    )
-    
-    # Reject other applications
-    await db.applications.update_many(
-        {"job_id": job_id, "application_id": {"$ne": application_id}},
-        {"$set": {"status": "rejected"}}
-    )
+    async def accept(session):
+        application = await db.applications.find_one(
+            {"application_id": application_id, "job_id": job_id},
+            {"_id": 0, "worker_user_id": 1},
+            session=session
+        )
+        if not application:
+            raise HTTPException(status_code=404, detail="Application not found")
+        
+        # Only an open job owned by the caller can move to in_progress, so two
+        # concurrent accepts cannot both assign a worker
+        job = await db.jobs.find_one_and_update(
+            {"job_id": job_id, "business_user_id": current_user.user_id, "status": "open"},
+            {"$set": {
+                "status": "in_progress",
+                "assigned_worker_id": application["worker_user_id"],
+                "start_time": datetime.now(timezone.utc)
+            }},
+            projection={"_id": 1},
+            session=session
+        )
+        if not job:
+            job = await db.jobs.find_one(
+                {"job_id": job_id}, {"_id": 0, "business_user_id": 1}, session=session
+            )
+            if not job:
+                raise HTTPException(status_code=404, detail="Job not found")
+            if job["business_user_id"] != current_user.user_id:
+                raise HTTPException(status_code=403, detail="Not authorized")
+            raise HTTPException(status_code=400, detail="Job is no longer open")
+        
+        # Accept this application and reject the others in one round trip
+        await db.applications.bulk_write([
+            UpdateOne({"application_id": application_id}, {"$set": {"status": "accepted"}}),
+            UpdateMany(
+                {"job_id": job_id, "application_id": {"$ne": application_id}},
+                {"$set": {"status": "rejected"}}
+            ),
+        ], ordered=False, session=session)
+        
+        chat_room = ChatRoom(
+            participants=[current_user.user_id, application["worker_user_id"]],
+            job_id=job_id
+        )
+        await db.chat_rooms.insert_one(chat_room.model_dump(), session=session)
+        return chat_room
     
-    # Create chat room
-    chat_room = ChatRoom(
-        participants=[current_user.user_id, application["worker_user_id"]],
-        job_id=job_id
-    )
-    await db.chat_rooms.insert_one(chat_room.model_dump())
+    chat_room = await run_atomically(accept)
+    mark_job_features_dirty()
     
     return {"message": "Application accepted", "chat_room_id": chat_room.room_id}
 
@@ -718,47 +2721,72 @@ async def complete_job(job_id: str, current_user: User = Depends(require_auth)):
     if job["status"] != "in_progress":
         raise HTTPException(status_code=400, detail="Job is not in progress")
     
-    await db.jobs.update_one(
-        {"job_id": job_id},
-        {"$set": {
-            "status": "completed",
-            "end_time": datetime.now(timezone.utc)
-        }}
-    )
+    async def complete(session):
+        # Worker stats are updated by the task queue after the response; the task
+        # is stored first so a crash before the job update cannot lose it
+        task_id = None
+        if job.get("assigned_worker_id"):
+            task_id = await task_queue.enqueue(
+                "job_completed", {"job_id": job_id, "worker_user_id": job["assigned_worker_id"]}, session=session
+            )
+        try:
+            await db.jobs.update_one(
+                {"job_id": job_id},
+                {"$set": {
+                    "status": "completed",
+                    "end_time": datetime.now(timezone.utc)
+                }},
+                session=session
+            )
+        except Exception:
+            if task_id and session is None:
+                await task_queue.discard(task_id)
+            raise
+        return task_id
     
-    # Update worker stats
-    if job.get("assigned_worker_id"):
-        await db.profiles.update_one(
-            {"user_id": job["assigned_worker_id"]},
-            {
-                "$inc": {"completed_jobs": 1, "prestige_score": 10},
-                "$set": {"updated_at": datetime.now(timezone.utc)}
-            }
-        )
+    task_queue.notify(await run_atomically(complete))
     
     return {"message": "Job completed"}
 
 @api_router.get("/my-jobs")
-async def get_my_jobs(current_user: User = Depends(require_auth)):
+async def get_my_jobs(
+    response: Response,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    view: Optional[str] = Query(None, description="Named field set, e.g. card or pin"),
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_user: User = Depends(require_auth)
+):
     """Get jobs for current user (posted by business or assigned to worker)"""
+    projection = field_projection("job", fields, view) or JOB_PUBLIC_PROJECTION
     profile = await db.profiles.find_one({"user_id": current_user.user_id}, {"_id": 0})
     if not profile:
         return []
     
     if profile.get("role") == "business":
-        jobs = await db.jobs.find({"business_user_id": current_user.user_id}, {"_id": 0}).to_list(100)
+        jobs, next_cursor = await paginate(
+            db.jobs, {"business_user_id": current_user.user_id}, "created_at", "job_id", cursor, limit,
+            projection=projection
+        )
     else:
-        # Get jobs where worker has applied or is assigned
-        applications = await db.applications.find({"worker_user_id": current_user.user_id}, {"_id": 0}).to_list(100)
+        # Get jobs where worker has applied or is assigned, paging over the applications
+        applications, next_cursor = await paginate(
+            db.applications, {"worker_user_id": current_user.user_id}, "created_at", "application_id", cursor, limit
+        )
         job_ids = [app["job_id"] for app in applications]
-        jobs = await db.jobs.find({"job_id": {"$in": job_ids}}, {"_id": 0}).to_list(100)
+        job_docs = await db.jobs.find({"job_id": {"$in": job_ids}}, projection).to_list(MAX_PAGE_SIZE)
         
-        # Add application status to each job
-        app_status = {app["job_id"]: app["status"] for app in applications}
-        for job in jobs:
-            job["application_status"] = app_status.get(job["job_id"])
-    
-    return jobs
+        # Keep application order and add application status to each job
+        jobs_by_id = {job["job_id"]: job for job in job_docs}
+        jobs = []
+        for app in applications:
+            job = jobs_by_id.get(app["job_id"])
+            if job:
+                job["application_status"] = app["status"]
+                jobs.append(job)
+    
+    set_next_cursor(response, next_cursor)
+    return json_list(jobs, response)
 
 # ==================== REVIEW ENDPOINTS ====================
 
@@ -779,14 +2807,6 @@ async def create_review(job_id: str, data: CreateReviewRequest, current_user: Us
     else:
         raise HTTPException(status_code=403, detail="Not authorized to review this job")
     
-    # Check if already reviewed
-    existing = await db.reviews.find_one({
-        "job_id": job_id,
-        "reviewer_user_id": current_user.user_id
-    })
-    if existing:
-        raise HTTPException(status_code=400, detail="Already reviewed this job")
-    
     review = Review(
         job_id=job_id,
         reviewer_user_id=current_user.user_id,
@@ -795,91 +2815,166 @@ async def create_review(job_id: str, data: CreateReviewRequest, current_user: Us
         comment=data.comment
     )
     
-    await db.reviews.insert_one(review.model_dump())
-    
-    # Update reviewed user's rating
-    reviews = await db.reviews.find({"reviewed_user_id": reviewed_user_id}, {"_id": 0}).to_list(1000)
-    avg_rating = sum(r["rating"] for r in reviews) / len(reviews)
-    
-    await db.profiles.update_one(
-        {"user_id": reviewed_user_id},
-        {"$set": {
-            "rating": round(avg_rating, 2),
-            "rating_count": len(reviews),
-            "updated_at": datetime.now(timezone.utc)
-        }}
-    )
-    
-    # Award badge if worker reaches milestones
-    profile = await db.profiles.find_one({"user_id": reviewed_user_id}, {"_id": 0})
-    if profile and profile.get("role") == "worker":
-        badges = profile.get("badges", [])
-        rating_count = len(reviews)
-        
-        if rating_count >= 5 and "rising_star" not in badges:
-            badges.append("rising_star")
-        if rating_count >= 20 and "trusted" not in badges:
-            badges.append("trusted")
-        if avg_rating >= 4.5 and rating_count >= 10 and "top_rated" not in badges:
-            badges.append("top_rated")
-        
-        await db.profiles.update_one(
-            {"user_id": reviewed_user_id},
-            {"$set": {"badges": badges}}
+    async def record(session):
+        # Rating counters and badges are updated by the task queue after the response;
+        # the task is stored first so a crash before the review insert cannot lose it
+        task_id = await task_queue.enqueue(
+            "review_created",
+            {"review_id": review.review_id, "reviewed_user_id": reviewed_user_id, "rating": review.rating},
+            session=session
         )
+        try:
+            await db.reviews.insert_one(review.model_dump(), session=session)
+        except Exception:
+            if session is None:
+                await task_queue.discard(task_id)
+            raise
+        return task_id
+    
+    # The unique (job_id, reviewer_user_id) index rejects duplicate reviews
+    try:
+        task_id = await run_atomically(record)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Already reviewed this job")
+    task_queue.notify(task_id)
     
     return review.model_dump()
 
 @api_router.get("/reviews/{user_id}")
-async def get_user_reviews(user_id: str):
+async def get_user_reviews(
+    user_id: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+):
     """Get reviews for a user"""
-    reviews = await db.reviews.find({"reviewed_user_id": user_id}, {"_id": 0}).to_list(100)
-    return reviews
+    reviews, next_cursor = await paginate(
+        db.reviews, {"reviewed_user_id": user_id}, "created_at", "review_id", cursor, limit
+    )
+    set_next_cursor(response, next_cursor)
+    return json_list(reviews, response)
 
 # ==================== CHAT ENDPOINTS ====================
 
 @api_router.get("/chats")
-async def get_chat_rooms(current_user: User = Depends(require_auth)):
+async def get_chat_rooms(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_user: User = Depends(require_auth)
+):
     """Get all chat rooms for current user"""
-    rooms = await db.chat_rooms.find(
-        {"participants": current_user.user_id},
-        {"_id": 0}
-    ).sort("last_message_time", -1).to_list(100)
+    rooms, next_cursor = await paginate(
+        db.chat_rooms, {"participants": current_user.user_id}, "last_message_time", "room_id", cursor, limit
+    )
+    set_next_cursor(response, next_cursor)
     
-    # Enrich with participant info
+    # Enrich with participant and job info using two bulk fetches
+    other_user_ids = {}
     for room in rooms:
-        other_user_id = [p for p in room["participants"] if p != current_user.user_id][0]
-        profile = await db.profiles.find_one({"user_id": other_user_id}, {"_id": 0})
-        room["other_participant"] = profile
-        
-        # Get job info if exists
+        other_user_ids[room["room_id"]] = next(
+            (p for p in room["participants"] if p != current_user.user_id), None
+        )
+    user_ids = list({uid for uid in other_user_ids.values() if uid})
+    job_ids = list({room["job_id"] for room in rooms if room.get("job_id")})
+    
+    profiles, jobs = await asyncio.gather(
+        db.profiles.find({"user_id": {"$in": user_ids}}, PARTICIPANT_SUMMARY_PROJECTION).to_list(MAX_PAGE_SIZE),
+        db.jobs.find({"job_id": {"$in": job_ids}}, JOB_SUMMARY_PROJECTION).to_list(MAX_PAGE_SIZE)
+    )
+    profiles_by_user = {profile["user_id"]: with_media_urls(profile, request) for profile in profiles}
+    jobs_by_id = {job["job_id"]: job for job in jobs}
+    
+    for room in rooms:
+        room["other_participant"] = profiles_by_user.get(other_user_ids[room["room_id"]])
         if room.get("job_id"):
-            job = await db.jobs.find_one({"job_id": room["job_id"]}, {"_id": 0})
-            room["job"] = job
+            room["job"] = jobs_by_id.get(room["job_id"])
+        room["unread_count"] = (room.pop("unread_counts", None) or {}).get(current_user.user_id, 0)
     
-    return rooms
+    return json_list(rooms, response)
+
+async def message_anchor_filter(room_id: str, after: str) -> Dict[str, Any]:
+    """Condition selecting messages newer than a message_id or an ISO timestamp"""
+    if after.startswith("msg_"):
+        anchor = await db.chat_messages.find_one(
+            {"chat_room_id": room_id, "message_id": after},
+            {"_id": 0, "created_at": 1, "message_id": 1}
+        )
+        if not anchor:
+            raise HTTPException(status_code=400, detail="Unknown message in after")
+        return seek_filter("created_at", "message_id", anchor["created_at"], anchor["message_id"], descending=False)
+    try:
+        since = datetime.fromisoformat(after.replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="after must be a message_id or ISO timestamp")
+    return {"created_at": {"$gt": since}}
 
 @api_router.get("/chats/{room_id}/messages")
-async def get_chat_messages(room_id: str, current_user: User = Depends(require_auth)):
-    """Get messages in a chat room"""
+async def get_chat_messages(
+    room_id: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_user: User = Depends(require_auth)
+):
+    """Get messages in a chat room.
+    
+    By default returns the newest page; X-Next-Cursor pages back to older messages.
+    With after=<message_id|timestamp> returns only newer messages (delta sync),
+    with X-Has-More set when the client should ask again from the last one.
+    Messages are always in ascending order.
+    """
     room = await db.chat_rooms.find_one({"room_id": room_id}, {"_id": 0})
     if not room:
         raise HTTPException(status_code=404, detail="Chat room not found")
     if current_user.user_id not in room["participants"]:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    messages = await db.chat_messages.find(
-        {"chat_room_id": room_id},
-        {"_id": 0}
-    ).sort("created_at", 1).to_list(100)
-    
-    # Mark messages as read
-    await db.chat_messages.update_many(
-        {"chat_room_id": room_id, "sender_user_id": {"$ne": current_user.user_id}},
-        {"$set": {"read": True}}
-    )
+    if after:
+        query = {"$and": [{"chat_room_id": room_id}, await message_anchor_filter(room_id, after)]}
+        messages, more = await paginate(
+            db.chat_messages, query, "created_at", "message_id", None, limit, descending=False
+        )
+        if more:
+            response.headers[HAS_MORE_HEADER] = "true"
+    else:
+        messages, next_cursor = await paginate(
+            db.chat_messages, {"chat_room_id": room_id}, "created_at", "message_id", cursor, limit
+        )
+        messages.reverse()
+        set_next_cursor(response, next_cursor)
+    
+    # Mark what this page showed as read, only when the room has unread messages (legacy
+    # rooms have no counter). Messages sent after the page was read stay unread.
+    unread = (room.get("unread_counts") or {}).get(current_user.user_id)
+    if messages and (unread is None or unread > 0):
+        newest = messages[-1]
+        marked = await db.chat_messages.update_many(
+            {
+                "chat_room_id": room_id,
+                "sender_user_id": {"$ne": current_user.user_id},
+                "read": False,
+                "$or": [
+                    {"created_at": {"$lt": newest["created_at"]}},
+                    {"created_at": newest["created_at"], "message_id": {"$lte": newest["message_id"]}}
+                ]
+            },
+            {"$set": {"read": True}}
+        )
+        if marked.modified_count:
+            # Decrement rather than reset so concurrent sends keep their increments
+            counter = f"unread_counts.{current_user.user_id}"
+            decremented = await db.chat_rooms.update_one(
+                {"room_id": room_id, counter: {"$gte": marked.modified_count}},
+                {"$inc": {counter: -marked.modified_count}}
+            )
+            if not decremented.matched_count:
+                # Legacy or drifted counter: it cannot go below zero
+                await db.chat_rooms.update_one({"room_id": room_id}, {"$set": {counter: 0}})
     
-    return messages
+    return json_list(messages, response)
 
 @api_router.post("/chats/{room_id}/messages")
 async def send_message(room_id: str, data: SendMessageRequest, current_user: User = Depends(require_auth)):
@@ -898,45 +2993,269 @@ async def send_message(room_id: str, data: SendMessageRequest, current_user: Use
     
     await db.chat_messages.insert_one(message.model_dump())
     
-    # Update room's last message
-    await db.chat_rooms.update_one(
-        {"room_id": room_id},
-        {"$set": {
-            "last_message": data.content[:100],
-            "last_message_time": datetime.now(timezone.utc)
-        }}
-    )
+    # Update room's last message and the other participants' unread counters
+    room_update = {"$set": {
+        "last_message": data.content[:100],
+        "last_message_time": datetime.now(timezone.utc)
+    }}
+    unread_increments = {
+        f"unread_counts.{user_id}": 1
+        for user_id in room["participants"] if user_id != current_user.user_id
+    }
+    if unread_increments:
+        room_update["$inc"] = unread_increments
+    await db.chat_rooms.update_one({"room_id": room_id}, room_update)
+    
+    # Queue for the participants' open sockets (including the sender's other devices)
+    chat_hub.publish(room["participants"], {
+        "type": "message",
+        "message": message.model_dump(mode="json")
+    })
     
     return message.model_dump()
 
+@api_router.websocket("/ws/chats")
+async def chat_socket(websocket: WebSocket, token: Optional[str] = None):
+    """Push new chat messages for all of the user's rooms.
+    
+    Authenticates with the session token from the cookie, the Authorization
+    header or the token query parameter (for clients that cannot set headers).
+    """
+    token = websocket.cookies.get("session_token") or token
+    authorization = websocket.headers.get("authorization")
+    if not token and authorization and authorization.startswith("Bearer "):
+        token = authorization[7:]
+    user = await resolve_session(token) if token else None
+    if not user:
+        await websocket.close(code=WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    chat_hub.connect(user.user_id, websocket, token)
+    try:
+        while True:
+            # Messages are sent over HTTP; the socket only answers keep-alive pings
+            incoming = await websocket.receive_text()
+            if incoming == "ping":
+                await websocket.send_text("pong")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        chat_hub.disconnect(user.user_id, websocket)
+
+# ==================== WORKER ENDPOINTS ====================
+
+@api_router.get("/workers/search")
+async def search_workers(
+    request: Request,
+    response: Response,
+    lat: float,
+    lng: float,
+    radius_km: float = Query(10.0, gt=0),
+    skills: Optional[List[str]] = Query(None),
+    skills_match: str = Query("all", pattern="^(all|any)$"),
+    min_rating: Optional[float] = Query(None, ge=0, le=5),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    view: Optional[str] = Query(None, description="Named field set, e.g. card or summary"),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    current_user: User = Depends(require_auth)
+):
+    """Find workers near a point, ranked by distance, rating and prestige (business only)"""
+    if current_user.role != "business":
+        raise HTTPException(status_code=403, detail="Only businesses can search workers")
+    projection = field_projection("profile", fields, view) or WORKER_CARD_PROJECTION
+    near = geo_point({"lat": lat, "lng": lng})
+    if not near:
+        raise HTTPException(status_code=400, detail="Invalid coordinates")
+    
+    query = {"role": "worker"}
+    if min_rating is not None:
+        query["rating"] = {"$gte": min_rating}
+    skill_condition = await skills_filter(skills or [], "skills", skills_match)
+    if skill_condition:
+        query.update(skill_condition)
+    
+    pipeline = [
+        {"$geoNear": {
+            "near": near,
+            "key": "geo",
+            "distanceField": "distance_m",
+            "maxDistance": radius_km * 1000,
+            "spherical": True,
+            "query": query
+        }},
+        {"$limit": WORKER_SEARCH_CANDIDATES},
+        {"$set": {"search_score": worker_search_score_expr()}}
+    ]
+    if cursor:
+        pipeline.append({"$match": keyset_filter("search_score", "user_id", cursor)})
+    pipeline += [
+        {"$sort": {"search_score": -1, "user_id": -1}},
+        {"$limit": limit + 1},
+        {"$project": {**projection, "distance_m": 1, "search_score": 1}}
+    ]
+    workers = await db.profiles.aggregate(pipeline).to_list(limit + 1)
+    
+    if len(workers) > limit:
+        workers = workers[:limit]
+        set_next_cursor(response, encode_cursor(workers[-1]["search_score"], workers[-1]["user_id"]))
+    for worker in workers:
+        worker["distance_km"] = round(worker.pop("distance_m") / 1000, 2)
+        worker["search_score"] = round(worker["search_score"], 4)
+        with_media_urls(worker, request)
+    return json_list(workers, response)
+
 # ==================== UTILITY ENDPOINTS ====================
 
+JOB_CATEGORIES = [
+    {"id": "food_service", "name": "Servicio de Alimentos", "icon": "restaurant"},
+    {"id": "retail", "name": "Retail / Ventas", "icon": "store"},
+    {"id": "cleaning", "name": "Limpieza", "icon": "cleaning-services"},
+    {"id": "delivery", "name": "Entregas", "icon": "delivery-dining"},
+    {"id": "hospitality", "name": "Hospitalidad", "icon": "hotel"},
+    {"id": "events", "name": "Eventos", "icon": "celebration"},
+    {"id": "warehouse", "name": "Almacén", "icon": "warehouse"},
+    {"id": "customer_service", "name": "Atención al Cliente", "icon": "support-agent"},
+    {"id": "admin", "name": "Administrativo", "icon": "description"},
+    {"id": "other", "name": "Otro", "icon": "more-horiz"}
+]
+# The static lists only change with a deploy, so their ETags are computed once
+JOB_CATEGORIES_ETAG = content_etag(JOB_CATEGORIES)
+SKILLS_CATALOG_ETAG = content_etag(SKILLS_CATALOG)
+
 @api_router.get("/categories")
-async def get_categories():
+async def get_categories(request: Request, response: Response):
     """Get available job categories"""
-    return [
-        {"id": "food_service", "name": "Servicio de Alimentos", "icon": "restaurant"},
-        {"id": "retail", "name": "Retail / Ventas", "icon": "store"},
-        {"id": "cleaning", "name": "Limpieza", "icon": "cleaning-services"},
-        {"id": "delivery", "name": "Entregas", "icon": "delivery-dining"},
-        {"id": "hospitality", "name": "Hospitalidad", "icon": "hotel"},
-        {"id": "events", "name": "Eventos", "icon": "celebration"},
-        {"id": "warehouse", "name": "Almacén", "icon": "warehouse"},
-        {"id": "customer_service", "name": "Atención al Cliente", "icon": "support-agent"},
-        {"id": "admin", "name": "Administrativo", "icon": "description"},
-        {"id": "other", "name": "Otro", "icon": "more-horiz"}
-    ]
+    return conditional_response(request, response, JOB_CATEGORIES, STATIC_CACHE_CONTROL, JOB_CATEGORIES_ETAG)
 
 @api_router.get("/skills")
-async def get_skills():
+async def get_skills(request: Request, response: Response):
     """Get available skills"""
-    return [
-        "Barista", "Cocina", "Atención al cliente", "Caja registradora",
-        "Limpieza", "Organización", "Manejo de inventario", "Conducir",
-        "Inglés", "Portugués", "Servicio de mesa", "Bartender",
-        "Seguridad", "Recepción", "Computación básica", "Excel",
-        "Redes sociales", "Fotografía", "Carga pesada", "Primeros auxilios"
-    ]
+    return conditional_response(request, response, SKILLS_CATALOG, STATIC_CACHE_CONTROL, SKILLS_CATALOG_ETAG)
+
+@api_router.get("/tasks/status")
+async def tasks_status():
+    """Background task queue depth and counters"""
+    return {
+        "workers": len(task_queue.workers),
+        "depth": await task_queue.depth(),
+        "counters": task_queue.stats
+    }
+
+@api_router.get("/compression/status")
+async def compression_status():
+    """Response compression counters: bytes saved and time spent compressing"""
+    bytes_in = compression_stats["bytes_in"]
+    return {
+        "encodings": COMPRESSION_ENCODINGS,
+        "min_bytes": COMPRESSION_MIN_BYTES,
+        "offload_bytes": COMPRESSION_OFFLOAD_BYTES,
+        "counters": compression_stats,
+        "bytes_saved": bytes_in - compression_stats["bytes_out"],
+        "ratio": round(compression_stats["bytes_out"] / bytes_in, 4) if bytes_in else 1.0
+    }
+
+@api_router.get("/metrics")
+async def metrics():
+    """Prometheus exposition of request, Mongo, AI upstream, compression and task queue metrics"""
+    lines = []
+    
+    routes = sorted(route_stats.items())
+    lines += prometheus_family(
+        "nomadshift_http_requests_total", "counter", "HTTP requests by route and status code",
+        [("", {"method": method, "route": route, "status": status}, count)
+         for (method, route), stats in routes for status, count in sorted(stats["statuses"].items())]
+    )
+    histogram = []
+    for (method, route), stats in routes:
+        labels = {"method": method, "route": route}
+        for bound, count in zip(LATENCY_BUCKETS, stats["buckets"]):
+            histogram.append(("_bucket", {**labels, "le": bound}, count))
+        histogram.append(("_bucket", {**labels, "le": "+Inf"}, stats["count"]))
+        histogram.append(("_sum", labels, round(stats["seconds"], 6)))
+        histogram.append(("_count", labels, stats["count"]))
+    lines += prometheus_family(
+        "nomadshift_http_request_duration_seconds", "histogram", "HTTP request latency by route", histogram
+    )
+    lines += prometheus_family(
+        "nomadshift_http_request_db_operations_total", "counter", "Mongo commands issued while serving the route",
+        [("", {"method": method, "route": route}, stats["db_operations"]) for (method, route), stats in routes]
+    )
+    lines += prometheus_family(
+        "nomadshift_http_request_db_seconds_total", "counter", "Time spent in Mongo commands while serving the route",
+        [("", {"method": method, "route": route}, round(stats["db_seconds"], 6)) for (method, route), stats in routes]
+    )
+    
+    with db_command_stats_lock:
+        commands = sorted((name, dict(stats)) for name, stats in db_command_stats.items())
+    lines += prometheus_family(
+        "nomadshift_mongo_commands_total", "counter", "Mongo commands by name",
+        [("", {"command": name}, stats["count"]) for name, stats in commands]
+    )
+    lines += prometheus_family(
+        "nomadshift_mongo_command_failures_total", "counter", "Failed Mongo commands by name",
+        [("", {"command": name}, stats["failures"]) for name, stats in commands]
+    )
+    lines += prometheus_family(
+        "nomadshift_mongo_command_seconds_total", "counter", "Time spent in Mongo commands by name",
+        [("", {"command": name}, round(stats["seconds"], 6)) for name, stats in commands]
+    )
+    
+    lines += prometheus_family(
+        "nomadshift_ai_events_total", "counter", "Z.ai upstream requests, calls, failures and fallbacks",
+        [("", {"event": event}, count) for event, count in sorted(ai_stats.items())]
+    )
+    lines += prometheus_family(
+        "nomadshift_ai_in_flight", "gauge", "Z.ai upstream calls in progress",
+        [("", {}, ai_gauges["in_flight"])]
+    )
+    lines += prometheus_family(
+        "nomadshift_ai_breaker_state", "gauge", "Z.ai circuit breaker state (1 for the current state)",
+        [("", {"state": state}, int(zai_breaker.state == state))
+         for state in (CircuitBreaker.CLOSED, CircuitBreaker.HALF_OPEN, CircuitBreaker.OPEN)]
+    )
+    lines += prometheus_family(
+        "nomadshift_ai_breaker_opened_total", "counter", "Times the Z.ai circuit breaker opened",
+        [("", {}, zai_breaker.times_opened)]
+    )
+    
+    lines += prometheus_family(
+        "nomadshift_compression_responses_total", "counter", "Compressed responses by encoding",
+        [("", {"encoding": encoding}, count) for encoding, count in compression_stats["by_encoding"].items()]
+    )
+    lines += prometheus_family(
+        "nomadshift_compression_skipped_small_total", "counter", "Compressible responses below the size threshold",
+        [("", {}, compression_stats["skipped_small"])]
+    )
+    lines += prometheus_family(
+        "nomadshift_compression_offloaded_total", "counter", "Responses compressed in the threadpool",
+        [("", {}, compression_stats["offloaded"])]
+    )
+    lines += prometheus_family(
+        "nomadshift_compression_bytes_total", "counter", "Response bytes before and after compression",
+        [("", {"stage": "in"}, compression_stats["bytes_in"]), ("", {"stage": "out"}, compression_stats["bytes_out"])]
+    )
+    lines += prometheus_family(
+        "nomadshift_compression_seconds_total", "counter", "Time spent compressing responses",
+        [("", {}, round(compression_stats["seconds"], 6))]
+    )
+    
+    lines += prometheus_family(
+        "nomadshift_tasks_total", "counter", "Background tasks by outcome",
+        [("", {"outcome": outcome}, count) for outcome, count in task_queue.stats.items()]
+    )
+    try:
+        depth = await task_queue.depth()
+    except Exception as e:
+        logger.warning(f"Task queue depth unavailable for metrics: {e}")
+        depth = {}
+    lines += prometheus_family(
+        "nomadshift_task_queue_depth", "gauge", "Background tasks waiting, running or failed",
+        [("", {"status": status}, count) for status, count in depth.items()]
+    )
+    
+    return Response(content="\n".join(lines) + "\n", media_type="text/plain; version=0.0.4; charset=utf-8")
 
 @api_router.get("/")
 async def root():
@@ -952,8 +3271,45 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, HAS_MORE_HEADER, "ETag"],
 )
 
+app.add_middleware(CompressionMiddleware)
+# Outermost, so request timings include CORS and compression
+app.add_middleware(MetricsMiddleware)
+
+@app.on_event("startup")
+async def startup_migrations():
+    log_index_report(await ensure_indexes())
+    mongo_features["transactions"] = await detect_transaction_support()
+    task_queue.start()
+    await backfill_geo_points()
+    await load_skill_registry()
+    # Legacy documents are migrated in the background so startup is not delayed
+    app.state.image_migration = asyncio.create_task(migrate_inline_profile_images())
+    app.state.skill_mask_backfill = asyncio.create_task(backfill_skill_masks())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await task_queue.stop()
+    await close_zai_client()
     client.close()
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    
+    parser = argparse.ArgumentParser(description="NomadShift database migrations")
+    parser.add_argument(
+        "command",
+        choices=["migrate", "check-indexes"],
+        help="migrate: create indexes and backfill data; check-indexes: only report drift"
+    )
+    args = parser.parse_args()
+    
+    check_only = args.command == "check-indexes"
+    index_report = asyncio.run(run_migrations(check_only=check_only))
+    print(json.dumps(index_report, indent=2))
+    # Non-zero exit when the database is missing indexes the handlers rely on
+    unhealthy = any("missing" in drift or "conflicting" in drift for drift in index_report.values())
+    sys.exit(1 if unhealthy else 0)
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+NomadShift Backend Load Test
+Boots backend/server.py against a local mongod, seeds test users and sessions
+(as in auth_testing.md) and drives the marketplace flow concurrently:
+browse jobs near a point, apply, accept, chat and review.
+
+Reports throughput and p50/p95/p99 latency per endpoint, and saves the results
+as JSON (test_reports/load/<commit>_<timestamp>.json) to compare commits.
+
+Usage: python load_test.py [--workers 40] [--businesses 10] [--rounds 3] [--concurrency 50]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+from pymongo import MongoClient
+
+ROOT_DIR = Path(__file__).parent
+BACKEND_DIR = ROOT_DIR / "backend"
+REPORTS_DIR = ROOT_DIR / "test_reports" / "load"
+
+# Seeded users are spread around this point (Buenos Aires)
+CENTER = {"lat": -34.6037, "lng": -58.3816}
+SPREAD_DEGREES = 0.05
+SKILLS = ["Barista", "Cocina", "Atención al cliente", "Caja registradora", "Limpieza", "Inglés"]
+CATEGORIES = ["food_service", "retail", "cleaning", "hospitality"]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def nearby_location():
+    return {
+        "lat": CENTER["lat"] + random.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+        "lng": CENTER["lng"] + random.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class ServerProcess:
+    """uvicorn running server:app against the load-test database"""
+
+    def __init__(self, mongo_url, db_name, port):
+        self.mongo_url = mongo_url
+        self.db_name = db_name
+        self.port = port
+        self.process = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/api"
+
+    def start(self, timeout=30):
+        env = {**os.environ, "MONGO_URL": self.mongo_url, "DB_NAME": self.db_name}
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(self.port),
+             "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"server.py exited with code {self.process.returncode}")
+            try:
+                if httpx.get(f"{self.base_url}/", timeout=1).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.25)
+        self.stop()
+        raise RuntimeError(f"server.py did not answer within {timeout}s")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def seed_users(db, role, count):
+    """Insert users and 7-day sessions directly, the way auth_testing.md does"""
+    now = datetime.now(timezone.utc)
+    users = []
+    for i in range(count):
+        user_id = f"user_load_{role}_{uuid.uuid4().hex[:8]}"
+        token = f"test_session_{uuid.uuid4().hex}"
+        db.users.insert_one({
+            "user_id": user_id,
+            "email": f"load.{role}.{i}.{user_id}@example.com",
+            "name": f"Load {role.title()} {i}",
+            "picture": "https://via.placeholder.com/150",
+            "created_at": now
+        })
+        db.user_sessions.insert_one({
+            "user_id": user_id,
+            "session_token": token,
+            "expires_at": now + timedelta(days=7),
+            "created_at": now
+        })
+        users.append({"user_id": user_id, "token": token, "role": role})
+    return users
+
+
+class LoadTester:
+    def __init__(self, base_url, concurrency):
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.limiter = asyncio.Semaphore(concurrency)
+        self.samples = {}  # endpoint -> list of (latency_seconds, status_code)
+        self.client = None
+
+    async def call(self, user, method, endpoint, path, **kwargs):
+        """Issue one request, recording its latency under the endpoint template"""
+        headers = {"Authorization": f"Bearer {user['token']}"} if user else {}
+        async with self.limiter:
+            started = time.perf_counter()
+            try:
+                response = await self.client.request(method, path, headers=headers, **kwargs)
+                status = response.status_code
+            except httpx.HTTPError:
+                response, status = None, 0
+            elapsed = time.perf_counter() - started
+        self.samples.setdefault(f"{method} /api{endpoint}", []).append((elapsed, status))
+        return response
+
+    @staticmethod
+    def json_of(response, default=None):
+        if response is None or response.status_code >= 400:
+            return default
+        return response.json()
+
+    # ---------- setup (not part of the measured flow) ----------
+
+    async def onboard(self, user):
+        await self.call(user, "POST", "/user/set-role", "/user/set-role", json={"role": user["role"]})
+        location = nearby_location()
+        if user["role"] == "worker":
+            body = {"name": f"Worker {user['user_id'][-4:]}", "age": random.randint(18, 40),
+                    "bio": "Disponible fines de semana", "skills": random.sample(SKILLS, 3),
+                    "location": location, "address": "Buenos Aires"}
+        else:
+            body = {"name": f"Owner {user['user_id'][-4:]}", "business_name": f"Café {user['user_id'][-4:]}",
+                    "skills": random.sample(CATEGORIES, 2), "location": location, "address": "Buenos Aires"}
+        await self.call(user, "POST", f"/onboarding/{user['role']}", f"/onboarding/{user['role']}", json=body)
+        user["location"] = location
+
+    # ---------- scenarios ----------
+
+    async def browse(self, worker, iterations):
+        """A worker scrolling the map and feed and opening a few jobs"""
+        for _ in range(iterations):
+            point = nearby_location()
+            jobs = self.json_of(await self.call(
+                worker, "GET", "/jobs", "/jobs",
+                params={"lat": point["lat"], "lng": point["lng"], "radius_km": 15, "view": "card", "limit": 50}
+            ), [])
+            await self.call(worker, "GET", "/jobs/recommended", "/jobs/recommended", params={"limit": 20})
+            for job in random.sample(jobs, min(3, len(jobs))):
+                await self.call(worker, "GET", "/jobs/{job_id}", f"/jobs/{job['job_id']}")
+            await self.call(worker, "GET", "/categories", "/categories")
+
+    async def hire(self, business, workers):
+        """Post a job, collect applications, accept one, chat, complete and review"""
+        job = self.json_of(await self.call(business, "POST", "/jobs", "/jobs", json={
+            "title": "Turno de barista",
+            "description": "Atención en barra, preparación de café y caja. " * 3,
+            "category": random.choice(CATEGORIES),
+            "skills_required": random.sample(SKILLS, 2),
+            "hourly_rate": round(random.uniform(8, 20), 2),
+            "duration_hours": random.choice([4, 6, 8]),
+            "location": business["location"],
+            "address": "Buenos Aires"
+        }))
+        if not job:
+            return
+        job_id = job["job_id"]
+
+        applicants = random.sample(workers, min(5, len(workers)))
+        await asyncio.gather(*[
+            self.call(worker, "POST", "/jobs/{job_id}/apply", f"/jobs/{job_id}/apply",
+                      json={"message": "Tengo experiencia"})
+            for worker in applicants
+        ])
+        applications = self.json_of(await self.call(
+            business, "GET", "/jobs/{job_id}/applications", f"/jobs/{job_id}/applications"
+        ), [])
+        if not applications:
+            return
+        chosen = applications[0]
+        accepted = self.json_of(await self.call(
+            business, "POST", "/jobs/{job_id}/accept/{application_id}",
+            f"/jobs/{job_id}/accept/{chosen['application_id']}"
+        ))
+        if not accepted:
+            return
+        worker = next(w for w in applicants if w["user_id"] == chosen["worker_user_id"])
+        room_id = accepted["chat_room_id"]
+
+        for i in range(4):
+            sender = business if i % 2 == 0 else worker
+            await self.call(sender, "POST", "/chats/{room_id}/messages", f"/chats/{room_id}/messages",
+                            json={"content": f"Mensaje {i} sobre el turno"})
+            await self.call(sender, "GET", "/chats", "/chats")
+            await self.call(sender, "GET", "/chats/{room_id}/messages", f"/chats/{room_id}/messages")
+
+        await self.call(business, "POST", "/jobs/{job_id}/complete", f"/jobs/{job_id}/complete")
+        await asyncio.gather(
+            self.call(business, "POST", "/jobs/{job_id}/review", f"/jobs/{job_id}/review",
+                      json={"rating": random.randint(3, 5), "comment": "Excelente"}),
+            self.call(worker, "POST", "/jobs/{job_id}/review", f"/jobs/{job_id}/review",
+                      json={"rating": random.randint(3, 5), "comment": "Buen lugar"}),
+        )
+        await self.call(business, "GET", "/reviews/{user_id}", f"/reviews/{worker['user_id']}")
+
+    async def run(self, workers, businesses, rounds, browse_iterations):
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=60, limits=limits) as client:
+            self.client = client
+            await asyncio.gather(*[self.onboard(user) for user in workers + businesses])
+            self.samples.clear()
+
+            started = time.perf_counter()
+            for _ in range(rounds):
+                await asyncio.gather(
+                    *[self.hire(business, workers) for business in businesses],
+                    *[self.browse(worker, browse_iterations) for worker in workers]
+                )
+            return time.perf_counter() - started
+
+    def report(self, wall_seconds):
+        endpoints = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            latencies = sorted(latency for latency, _ in samples)
+            statuses = {}
+            for _, status in samples:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            endpoints[endpoint] = {
+                "requests": len(samples),
+                "errors": sum(1 for _, status in samples if status == 0 or status >= 500),
+                "statuses": statuses,
+                "throughput_rps": round(len(samples) / wall_seconds, 2),
+                "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+                "max_ms": round(latencies[-1] * 1000, 2),
+            }
+        all_latencies = sorted(latency for samples in self.samples.values() for latency, _ in samples)
+        totals = {
+            "requests": len(all_latencies),
+            "errors": sum(e["errors"] for e in endpoints.values()),
+            "throughput_rps": round(len(all_latencies) / wall_seconds, 2),
+            "p50_ms": round(percentile(all_latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(all_latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(all_latencies, 99) * 1000, 2),
+        }
+        return endpoints, totals
+
+
+def print_report(endpoints, totals, wall_seconds):
+    print(f"\n{'endpoint':<48} {'reqs':>6} {'err':>4} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for endpoint, stats in endpoints.items():
+        print(f"{endpoint:<48} {stats['requests']:>6} {stats['errors']:>4} {stats['throughput_rps']:>8} "
+              f"{stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['p99_ms']:>8}")
+    print(f"{'TOTAL':<48} {totals['requests']:>6} {totals['errors']:>4} {totals['throughput_rps']:>8} "
+          f"{totals['p50_ms']:>8} {totals['p95_ms']:>8} {totals['p99_ms']:>8}")
+    print(f"\nWall time: {wall_seconds:.2f}s (latencies in ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NomadShift local load test")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default=None, help="defaults to a fresh nomadshift_load_<timestamp> database")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=40)
+    parser.add_argument("--businesses", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=3, help="hiring flows per business")
+    parser.add_argument("--browse-iterations", type=int, default=5, help="browse passes per worker and round")
+    parser.add_argument("--concurrency", type=int, default=50, help="maximum requests in flight")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", default=None, help="results JSON path")
+    parser.add_argument("--keep-db", action="store_true", help="do not drop the load-test database afterwards")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    started_at = datetime.now(timezone.utc)
+    db_name = args.db_name or f"nomadshift_load_{int(time.time())}"
+    mongo = MongoClient(args.mongo_url, serverSelectionTimeoutMS=5000)
+    mongo.admin.command("ping")
+    db = mongo[db_name]
+
+    workers = seed_users(db, "worker", args.workers)
+    businesses = seed_users(db, "business", args.businesses)
+    print(f"Seeded {len(workers)} workers and {len(businesses)} businesses in {db_name}")
+
+    server = ServerProcess(args.mongo_url, db_name, args.port)
+    server.start()
+    try:
+        tester = LoadTester(server.base_url, args.concurrency)
+        wall_seconds = asyncio.run(tester.run(workers, businesses, args.rounds, args.browse_iterations))
+    finally:
+        server.stop()
+        if not args.keep_db:
+            mongo.drop_database(db_name)
+
+    endpoints, totals = tester.report(wall_seconds)
+    print_report(endpoints, totals, wall_seconds)
+
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "started_at": started_at.isoformat(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "wall_seconds": round(wall_seconds, 3),
+        "totals": totals,
+        "endpoints": endpoints,
+    }
+    output = Path(args.output) if args.output else REPORTS_DIR / f"{commit}_{int(time.time())}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Results saved to {output}")
+    sys.exit(1 if totals["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
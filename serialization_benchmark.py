@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+NomadShift response serialization micro-benchmark
+Compares the stdlib path (jsonable_encoder + JSONResponse) with the orjson path
+used by the list endpoints, on documents shaped like what Mongo returns.
+
+Usage: python serialization_benchmark.py [--docs 100] [--rounds 200]
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+# server.py reads these at import time; no connection is made
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "nomadshift_benchmark")
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import server
+
+
+def mongo_doc(model):
+    """Mongo hands back naive UTC datetimes"""
+    doc = model.model_dump()
+    for key, value in doc.items():
+        if isinstance(value, datetime):
+            doc[key] = value.replace(tzinfo=None)
+    return doc
+
+
+def job_docs(n):
+    docs = []
+    for i in range(n):
+        job = mongo_doc(server.Job(
+            business_user_id=f"user_{i:012d}",
+            business_name="Café Central",
+            title=f"Barista turno mañana {i}",
+            description="Preparación de café, atención en barra y caja. " * 4,
+            category="food_service",
+            skills_required=["Barista", "Atención al cliente", "Caja registradora"],
+            hourly_rate=12.5 + i % 7,
+            duration_hours=6,
+            location={"lat": -34.6 + i / 1000, "lng": -58.38 - i / 1000},
+            address="Av. Corrientes 1234, Buenos Aires"
+        ))
+        job["distance_km"] = round(i * 0.37, 2)
+        docs.append(job)
+    return docs
+
+
+def message_docs(n):
+    start = datetime(2026, 1, 1, 12, 0)
+    docs = []
+    for i in range(n):
+        message = mongo_doc(server.ChatMessage(
+            chat_room_id="room_0123456789ab",
+            sender_user_id=f"user_{i % 2:012d}",
+            content=f"Hola, ¿a qué hora empieza el turno del día {i}?"
+        ))
+        message["created_at"] = start + timedelta(seconds=i)
+        docs.append(message)
+    return docs
+
+
+def chat_room_docs(n):
+    docs = []
+    for i in range(n):
+        room = mongo_doc(server.ChatRoom(
+            participants=["user_000000000001", f"user_{i:012d}"],
+            job_id=f"job_{i:012d}",
+            last_message="Perfecto, nos vemos mañana",
+            last_message_time=datetime(2026, 1, 1, 12, 0) + timedelta(minutes=i)
+        ))
+        room.pop("unread_counts")
+        room["unread_count"] = i % 3
+        room["other_participant"] = {"user_id": f"user_{i:012d}", "name": "Lucía", "photo": None, "role": "worker"}
+        room["job"] = {"job_id": f"job_{i:012d}", "title": "Barista", "category": "food_service",
+                       "business_name": "Café Central", "hourly_rate": 12.5, "duration_hours": 6,
+                       "address": "Av. Corrientes 1234", "status": "in_progress"}
+        docs.append(room)
+    return docs
+
+
+def review_docs(n):
+    return [
+        mongo_doc(server.Review(
+            job_id=f"job_{i:012d}",
+            reviewer_user_id="user_000000000001",
+            reviewed_user_id="user_000000000002",
+            rating=1 + i % 5,
+            comment="Muy puntual y amable con los clientes"
+        ))
+        for i in range(n)
+    ]
+
+
+ENDPOINTS = {
+    "GET /api/jobs": job_docs,
+    "GET /api/chats/{room_id}/messages": message_docs,
+    "GET /api/chats": chat_room_docs,
+    "GET /api/reviews/{user_id}": review_docs,
+}
+
+
+def stdlib_path(docs):
+    return JSONResponse(jsonable_encoder(docs)).body
+
+
+def orjson_path(docs):
+    return server.json_list(docs).body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--docs", type=int, default=server.DEFAULT_PAGE_SIZE, help="documents per response")
+    parser.add_argument("--rounds", type=int, default=200, help="serializations per measurement")
+    args = parser.parse_args()
+
+    print(f"{'endpoint':<36} {'stdlib µs':>10} {'orjson µs':>10} {'speedup':>8}")
+    for endpoint, build in ENDPOINTS.items():
+        docs = build(args.docs)
+        # Both paths must produce the same JSON document
+        assert json.loads(stdlib_path(docs)) == json.loads(orjson_path(docs)), endpoint
+
+        before = min(timeit.repeat(lambda: stdlib_path(docs), number=args.rounds, repeat=5)) / args.rounds
+        after = min(timeit.repeat(lambda: orjson_path(docs), number=args.rounds, repeat=5)) / args.rounds
+        print(f"{endpoint:<36} {before * 1e6:>10.1f} {after * 1e6:>10.1f} {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
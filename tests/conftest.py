@@ -0,0 +1,225 @@
+import os
+import sys
+from copy import deepcopy
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+# server.py reads these at import time; the Motor client connects lazily
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "nomadshift_test")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+from pymongo import ReturnDocument  # noqa: E402
+from pymongo.errors import DuplicateKeyError  # noqa: E402
+
+
+# ==================== MONGO FAKES ====================
+# Just enough of Motor's collection API for the queries server.py issues
+
+def get_path(doc, path):
+    for part in path.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return None
+        doc = doc[part]
+    return doc
+
+
+def matches_condition(value, condition):
+    if isinstance(condition, dict) and any(key.startswith("$") for key in condition):
+        for op, operand in condition.items():
+            values = value if isinstance(value, list) else [value]
+            if op == "$in" and not any(v in operand for v in values):
+                return False
+            if op == "$ne" and operand in values:
+                return False
+            if op == "$exists" and (value is not None) != operand:
+                return False
+            if op in ("$lt", "$lte", "$gt", "$gte"):
+                if value is None:
+                    return False
+                compare = {"$lt": value.__lt__, "$lte": value.__le__, "$gt": value.__gt__, "$gte": value.__ge__}[op]
+                if not compare(operand):
+                    return False
+        return True
+    if isinstance(value, list) and not isinstance(condition, list):
+        return condition in value
+    return value == condition
+
+
+def matches(doc, query):
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif not matches_condition(get_path(doc, key), condition):
+            return False
+    return True
+
+
+def project(doc, projection):
+    doc = deepcopy(doc)
+    if not projection:
+        return doc
+    included = {field for field, flag in projection.items() if flag and field != "_id"}
+    if included:
+        return {field: doc[field] for field in included if field in doc}
+    return {field: value for field, value in doc.items() if projection.get(field, 1)}
+
+
+def parent_of(doc, path):
+    """Containing dict and last key of a dotted path, creating embedded documents"""
+    *parents, key = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    return doc, key
+
+
+def apply_update(doc, update):
+    for path, value in update.get("$set", {}).items():
+        parent, key = parent_of(doc, path)
+        parent[key] = value
+    for path in update.get("$unset", {}):
+        parent, key = parent_of(doc, path)
+        parent.pop(key, None)
+    for path, amount in update.get("$inc", {}).items():
+        parent, key = parent_of(doc, path)
+        parent[key] = parent.get(key, 0) + amount
+    for path, value in update.get("$push", {}).items():
+        parent, key = parent_of(doc, path)
+        items = parent.setdefault(key, [])
+        if isinstance(value, dict) and "$each" in value:
+            items.extend(value["$each"])
+            if "$slice" in value:
+                parent[key] = items[value["$slice"]:] if value["$slice"] < 0 else items[:value["$slice"]]
+        else:
+            items.append(value)
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, direction=1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, order in reversed(keys):
+            self.docs.sort(key=lambda doc: (get_path(doc, field) is not None, get_path(doc, field)), reverse=order < 0)
+        return self
+
+    def limit(self, count):
+        if count:
+            self.docs = self.docs[:count]
+        return self
+
+    async def to_list(self, length=None):
+        return self.docs if length is None else self.docs[:length]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeCollection:
+    def __init__(self, docs=None, unique=()):
+        self.docs = [deepcopy(doc) for doc in docs or []]
+        self.unique = [tuple(fields) for fields in unique]
+        self.calls = []  # (method, query, projection) of every read
+
+    def _check_unique(self, doc, ignore=None):
+        for fields in self.unique:
+            key = [get_path(doc, field) for field in fields]
+            if any(other is not ignore and [get_path(other, field) for field in fields] == key for other in self.docs):
+                raise DuplicateKeyError(f"duplicate key {dict(zip(fields, key))}")
+
+    async def insert_one(self, doc, session=None):
+        self._check_unique(doc)
+        self.docs.append(deepcopy(doc))
+        return SimpleNamespace(inserted_id=doc.get("_id"))
+
+    def find(self, query=None, projection=None, session=None):
+        self.calls.append(("find", query, projection))
+        return FakeCursor([project(doc, projection) for doc in self.docs if matches(doc, query)])
+
+    async def find_one(self, query=None, projection=None, session=None):
+        self.calls.append(("find_one", query, projection))
+        found = next((doc for doc in self.docs if matches(doc, query)), None)
+        return project(found, projection) if found is not None else None
+
+    async def count_documents(self, query, session=None):
+        return sum(1 for doc in self.docs if matches(doc, query))
+
+    async def update_one(self, query, update, upsert=False, session=None):
+        if isinstance(update, list):
+            raise NotImplementedError("update pipelines are not supported by the fake")
+        doc = next((doc for doc in self.docs if matches(doc, query)), None)
+        if doc is None:
+            return SimpleNamespace(matched_count=0, modified_count=0)
+        apply_update(doc, update)
+        return SimpleNamespace(matched_count=1, modified_count=1)
+
+    async def update_many(self, query, update, session=None):
+        found = [doc for doc in self.docs if matches(doc, query)]
+        for doc in found:
+            apply_update(doc, update)
+        return SimpleNamespace(matched_count=len(found), modified_count=len(found))
+
+    async def delete_one(self, query, session=None):
+        doc = next((doc for doc in self.docs if matches(doc, query)), None)
+        if doc is not None:
+            self.docs.remove(doc)
+        return SimpleNamespace(deleted_count=int(doc is not None))
+
+    async def delete_many(self, query, session=None):
+        found = [doc for doc in self.docs if matches(doc, query)]
+        self.docs = [doc for doc in self.docs if doc not in found]
+        return SimpleNamespace(deleted_count=len(found))
+
+    async def find_one_and_update(self, query, update, projection=None, upsert=False,
+                                  return_document=ReturnDocument.BEFORE, session=None):
+        doc = next((doc for doc in self.docs if matches(doc, query)), None)
+        if doc is None:
+            if not upsert:
+                return None
+            doc = {key: value for key, value in query.items() if not key.startswith("$")}
+            self.docs.append(doc)
+        before = deepcopy(doc)
+        apply_update(doc, update)
+        return project(doc if return_document == ReturnDocument.AFTER else before, projection)
+
+
+class FakeDatabase:
+    """server.db stand-in; collections are created on first use"""
+
+    def __init__(self):
+        self.collections = {}
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, FakeCollection())
+
+    def add(self, name, docs=(), unique=()):
+        self.collections[name] = FakeCollection(docs, unique)
+        return self.collections[name]
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """In-memory server.db, without transactions, with a fresh skill registry cache"""
+    db = FakeDatabase()
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "skill_bits", {})
+    monkeypatch.setitem(server.mongo_features, "transactions", False)
+    return db
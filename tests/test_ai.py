@@ -0,0 +1,173 @@
+import asyncio
+
+import httpx
+import pytest
+
+import server
+
+IMPROVED = "Barista con cinco años de experiencia y excelente atención al cliente."
+
+
+class ChatCompletionsStub:
+    """Stands in for the Z.ai chat-completions API through an httpx MockTransport"""
+
+    def __init__(self, status_code=200, delay=0.0):
+        self.status_code = status_code
+        self.delay = delay
+        self.calls = 0
+        self.release = None  # optional asyncio.Event the stub waits on
+
+    async def handler(self, request):
+        self.calls += 1
+        if self.release is not None:
+            await self.release.wait()
+        elif self.delay:
+            await asyncio.sleep(self.delay)
+        if self.status_code != 200:
+            return httpx.Response(self.status_code, json={"error": "upstream failure"})
+        return httpx.Response(200, json={"choices": [{"message": {"content": f"  {IMPROVED}  "}}]})
+
+
+@pytest.fixture
+def ai_state(monkeypatch):
+    """Fresh cache, counters, breaker and limiter, and an authenticated test user"""
+    monkeypatch.setattr(server, "ai_cache", server.TTLCache(100, 60))
+    monkeypatch.setattr(server, "ai_inflight", {})
+    monkeypatch.setattr(server, "ai_stats", {key: 0 for key in server.ai_stats})
+    monkeypatch.setattr(server, "zai_breaker", server.CircuitBreaker("zai-test", 5, 30))
+    monkeypatch.setattr(server, "zai_semaphore", asyncio.Semaphore(10))
+    monkeypatch.setattr(server, "zai_client", None)
+    server.app.dependency_overrides[server.require_auth] = lambda: server.User(
+        user_id="user_test", email="test@example.com", name="Test User", role="worker"
+    )
+    yield
+    server.app.dependency_overrides.clear()
+
+
+def run_against(stub, scenario):
+    """Run scenario(api) with Z.ai answered by stub; api is a client for the app"""
+    async def main():
+        server.zai_client = httpx.AsyncClient(transport=httpx.MockTransport(stub.handler))
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver/api") as api:
+            try:
+                return await scenario(api)
+            finally:
+                await server.zai_client.aclose()
+    return asyncio.run(main())
+
+
+def improve(api, description, context="profile"):
+    return api.post("/ai/improve-description", json={"description": description, "context": context})
+
+
+def test_concurrent_identical_requests_share_one_upstream_call(ai_state):
+    stub = ChatCompletionsStub(delay=0.05)
+
+    async def scenario(api):
+        return await asyncio.gather(*(improve(api, "Soy barista con experiencia") for _ in range(8)))
+
+    responses = run_against(stub, scenario)
+
+    assert stub.calls == 1
+    assert all(r.status_code == 200 for r in responses)
+    assert all(r.json() == {"original": "Soy barista con experiencia", "improved": IMPROVED} for r in responses)
+
+
+def test_cached_improvement_skips_the_upstream(ai_state):
+    stub = ChatCompletionsStub()
+
+    async def scenario(api):
+        first = await improve(api, "Soy barista con experiencia")
+        # Whitespace differences hit the same cache entry
+        second = await improve(api, "  Soy barista   con experiencia ")
+        return first, second
+
+    first, second = run_against(stub, scenario)
+
+    assert stub.calls == 1
+    assert first.json()["improved"] == second.json()["improved"] == IMPROVED
+
+
+def test_non_200_upstream_falls_back_and_is_not_cached(ai_state):
+    stub = ChatCompletionsStub(status_code=503)
+    description = "Buscamos ayudante de cocina para fines de semana"
+
+    async def scenario(api):
+        return [await improve(api, description, "job") for _ in range(2)]
+
+    responses = run_against(stub, scenario)
+
+    for response in responses:
+        body = response.json()
+        assert response.status_code == 200
+        assert body["fallback"] is True
+        assert body["improved"] == server.generate_fallback_improvement(description, "job")
+    # Failures are not cached, so the second request tried the upstream again
+    assert stub.calls == 2
+    assert server.ai_stats["fallbacks"] == 2
+
+
+def test_breaker_opens_after_repeated_failures_and_recovers_through_a_probe(ai_state, monkeypatch):
+    monkeypatch.setattr(server, "zai_breaker", server.CircuitBreaker("zai-test", 2, 30))
+    breaker = server.zai_breaker
+    stub = ChatCompletionsStub(status_code=500)
+
+    async def scenario(api):
+        failures = [await improve(api, f"Descripción número {i}") for i in range(2)]
+        assert breaker.state == breaker.OPEN
+        rejected = await improve(api, "Descripción mientras el circuito está abierto")
+        assert stub.calls == 2  # rejected without reaching the upstream
+
+        # Cool-down elapses: one probe goes through and its success closes the circuit
+        breaker.reset_seconds = 0
+        stub.status_code = 200
+        probe = await improve(api, "Descripción de prueba")
+        return failures + [rejected], probe
+
+    fallbacks, probe = run_against(stub, scenario)
+
+    assert all(r.json()["fallback"] is True for r in fallbacks)
+    assert server.ai_stats["breaker_rejections"] == 1
+    assert probe.json()["improved"] == IMPROVED
+    assert breaker.state == breaker.CLOSED
+    assert breaker.times_opened == 1
+    assert stub.calls == 3
+
+
+def test_half_open_breaker_admits_one_probe_and_reopens_on_failure():
+    breaker = server.CircuitBreaker("probe-test", 1, 0)
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+
+    assert breaker.allow() is True
+    assert breaker.state == breaker.HALF_OPEN
+    assert breaker.allow() is False  # the probe is still in flight
+
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+    assert breaker.times_opened == 2
+
+
+def test_full_limiter_falls_back_after_the_queue_timeout(ai_state, monkeypatch):
+    monkeypatch.setattr(server, "zai_semaphore", asyncio.Semaphore(1))
+    monkeypatch.setattr(server, "ZAI_QUEUE_TIMEOUT_SECONDS", 0.05)
+    stub = ChatCompletionsStub()
+
+    async def scenario(api):
+        stub.release = asyncio.Event()
+        holder = asyncio.create_task(improve(api, "Ocupa el único hueco disponible"))
+        while stub.calls == 0:
+            await asyncio.sleep(0.01)
+        queued = await improve(api, "Espera un hueco que no llega")
+        stub.release.set()
+        return await holder, queued
+
+    holder, queued = run_against(stub, scenario)
+
+    assert holder.json()["improved"] == IMPROVED
+    assert queued.json()["fallback"] is True
+    assert server.ai_stats["queue_timeouts"] == 1
+    assert stub.calls == 1
+    # A queue timeout is not an upstream failure
+    assert server.zai_breaker.failures == 0
@@ -0,0 +1,32 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+WORKER = {
+    "user_id": "user_worker", "role": "worker", "name": "Lucía", "bio": "Barista",
+    "skills": ["Barista"], "rating": 4.8, "email": "lucia@example.com", "phone": "+54 11 5555 0000"
+}
+
+
+@pytest.fixture
+def client(fake_db):
+    fake_db.add("jobs", [{"job_id": "job_1", "business_user_id": "user_business"}])
+    fake_db.add("applications", [{"application_id": "app_1", "job_id": "job_1", "worker_user_id": "user_worker"}])
+    fake_db.add("profiles", [WORKER])
+    server.app.dependency_overrides[server.require_auth] = lambda: server.User(
+        user_id="user_business", email="cafe@example.com", name="Café Central", role="business"
+    )
+    # Not entered as a context manager, so the startup hooks (indexes, task workers) do not run
+    yield TestClient(server.app)
+    server.app.dependency_overrides.clear()
+
+
+def test_empty_worker_view_falls_back_to_the_card(client, fake_db):
+    response = client.get("/api/jobs/job_1/applications", params={"worker_view": ""})
+
+    assert response.status_code == 200
+    assert fake_db.profiles.calls[-1][2] == server.WORKER_CARD_PROJECTION
+    worker = response.json()[0]["worker_profile"]
+    assert worker["name"] == "Lucía"
+    assert "email" not in worker and "phone" not in worker
@@ -0,0 +1,98 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+import server
+
+
+class FakeWebSocket:
+    """Records sent events and close codes; a stalled one never finishes a send"""
+
+    def __init__(self, stalled=False):
+        self.stalled = stalled
+        self.sent = []
+        self.close_code = None
+
+    async def send_json(self, event):
+        if self.stalled:
+            await asyncio.Event().wait()
+        self.sent.append(event)
+
+    async def close(self, code=1000):
+        self.close_code = code
+
+
+def test_stalled_socket_is_closed_without_delaying_publish(monkeypatch):
+    monkeypatch.setattr(server, "WS_SEND_TIMEOUT_SECONDS", 0.05)
+
+    async def main():
+        hub = server.ChatHub()
+        healthy, stalled = FakeWebSocket(), FakeWebSocket(stalled=True)
+        hub.connect("user_a", healthy, "token_a")
+        hub.connect("user_b", stalled, "token_b")
+
+        for i in range(3):
+            hub.publish(["user_a", "user_b"], {"type": "message", "n": i})
+        await asyncio.sleep(0.2)
+        return hub, healthy, stalled
+
+    hub, healthy, stalled = asyncio.run(main())
+
+    assert [event["n"] for event in healthy.sent] == [0, 1, 2]
+    assert stalled.close_code == server.WS_1011_INTERNAL_ERROR
+    assert "user_b" not in hub.connections
+    assert stalled not in hub.senders
+
+
+def test_socket_too_far_behind_is_dropped(monkeypatch):
+    monkeypatch.setattr(server, "WS_SEND_QUEUE_SIZE", 2)
+
+    async def main():
+        hub = server.ChatHub()
+        stalled = FakeWebSocket(stalled=True)
+        hub.connect("user_b", stalled, "token_b")
+        # The sender takes the first event and stalls on it; two more fill the outbox
+        for i in range(4):
+            hub.publish(["user_b"], {"type": "message", "n": i})
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.01)
+        return hub, stalled
+
+    hub, stalled = asyncio.run(main())
+
+    assert stalled.close_code == server.WS_1011_INTERNAL_ERROR
+    assert hub.connections == {}
+    assert hub.outboxes == {}
+
+
+def test_reading_a_page_keeps_messages_sent_meanwhile_unread(fake_db, monkeypatch):
+    start = datetime(2026, 1, 1, 12, 0)
+    fake_db.add("chat_rooms", [{"room_id": "room_1", "participants": ["user_a", "user_b"], "unread_counts": {"user_a": 2}}])
+    messages = fake_db.add("chat_messages", [
+        {"message_id": f"msg_{i}", "chat_room_id": "room_1", "sender_user_id": "user_b", "content": str(i),
+         "read": False, "created_at": start + timedelta(seconds=i)}
+        for i in range(2)
+    ])
+    paginate = server.paginate
+
+    async def paginate_then_receive(*args, **kwargs):
+        page = await paginate(*args, **kwargs)
+        # user_b sends another message after the page was read, as send_message would
+        messages.docs.append({"message_id": "msg_2", "chat_room_id": "room_1", "sender_user_id": "user_b",
+                              "content": "2", "read": False, "created_at": start + timedelta(seconds=2)})
+        await fake_db.chat_rooms.update_one({"room_id": "room_1"}, {"$inc": {"unread_counts.user_a": 1}})
+        return page
+
+    monkeypatch.setattr(server, "paginate", paginate_then_receive)
+    server.app.dependency_overrides[server.require_auth] = lambda: server.User(
+        user_id="user_a", email="a@example.com", name="A", role="worker"
+    )
+    try:
+        response = TestClient(server.app).get("/api/chats/room_1/messages")
+    finally:
+        server.app.dependency_overrides.clear()
+
+    assert [message["message_id"] for message in response.json()] == ["msg_0", "msg_1"]
+    assert [message["read"] for message in messages.docs] == [True, True, False]
+    assert fake_db.chat_rooms.docs[0]["unread_counts"] == {"user_a": 1}
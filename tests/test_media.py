@@ -0,0 +1,42 @@
+import asyncio
+import base64
+import io
+
+from gridfs.errors import FileExists
+
+import server
+
+
+class FakeBucket:
+    """GridFS bucket rejecting a second upload of the same _id, like GridIn does"""
+
+    def __init__(self):
+        self.files = {}
+
+    async def upload_from_stream_with_id(self, file_id, filename, source, metadata=None):
+        await asyncio.sleep(0)
+        if file_id in self.files:
+            raise FileExists(f"file with _id {file_id!r} already exists")
+        self.files[file_id] = source
+
+
+def image_data_uri():
+    if server.Image is None:
+        return "data:image/png;base64," + base64.b64encode(b"not really a png").decode()
+    out = io.BytesIO()
+    server.Image.new("RGB", (32, 32), (200, 120, 40)).save(out, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(out.getvalue()).decode()
+
+
+def test_duplicate_gallery_photos_are_stored_once(fake_db, monkeypatch):
+    # media.files stays empty, as seen by concurrent uploads racing on the same blob
+    bucket = FakeBucket()
+    monkeypatch.setattr(server, "media_bucket", bucket)
+
+    photo = image_data_uri()
+    urls = asyncio.run(server.store_images([photo, photo, photo]))
+
+    assert len(set(urls)) == 1
+    assert urls[0].startswith(server.MEDIA_PATH)
+    # One original, plus its thumbnail when Pillow is installed
+    assert len(bucket.files) == (1 if server.Image is None else 2)
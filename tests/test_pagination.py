@@ -0,0 +1,74 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+START = datetime(2026, 1, 1, 12, 0)  # Mongo hands back naive UTC datetimes
+
+# Rooms without messages have no last_message_time; several share one
+ROOMS = [
+    {"room_id": "room_a", "last_message_time": START},
+    {"room_id": "room_b", "last_message_time": None},
+    {"room_id": "room_c", "last_message_time": START + timedelta(minutes=5)},
+    {"room_id": "room_d", "last_message_time": START},
+    {"room_id": "room_e", "last_message_time": None},
+    {"room_id": "room_f", "last_message_time": START},
+    {"room_id": "room_g", "last_message_time": START + timedelta(minutes=1)},
+]
+
+
+def mongo_order(rooms, descending):
+    """Mongo's order for (last_message_time, room_id): nulls sort lowest"""
+    key = lambda room: (room["last_message_time"] is not None, room["last_message_time"] or START, room["room_id"])
+    return [room["room_id"] for room in sorted(rooms, key=key, reverse=descending)]
+
+
+def walk(collection, descending, limit, projection=None):
+    """All pages of a keyset scan, following each next cursor"""
+    async def main():
+        pages, cursor = [], None
+        while True:
+            docs, cursor = await server.paginate(
+                collection, {}, "last_message_time", "room_id", cursor, limit,
+                descending=descending, projection=projection
+            )
+            pages.append(docs)
+            if not cursor:
+                return pages
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("descending", [True, False])
+@pytest.mark.parametrize("limit", [1, 2, 3])
+def test_pages_cover_null_and_equal_sort_keys_once_in_order(fake_db, descending, limit):
+    rooms = fake_db.add("chat_rooms", ROOMS)
+
+    pages = walk(rooms, descending, limit)
+
+    assert [doc["room_id"] for page in pages for doc in page] == mongo_order(ROOMS, descending)
+    assert all(len(page) <= limit for page in pages)
+
+
+def test_sparse_projection_pages_without_returning_the_cursor_fields(fake_db):
+    rooms = fake_db.add("chat_rooms", ROOMS)
+
+    pages = walk(rooms, True, 2, projection={"_id": 0, "room_id": 1})
+
+    assert [doc for page in pages for doc in page] == [{"room_id": room_id} for room_id in mongo_order(ROOMS, True)]
+
+
+@pytest.mark.parametrize("value", [START, START + timedelta(microseconds=123456), None, 12.5, "texto"])
+def test_cursor_round_trip_keeps_the_sort_value(value):
+    decoded, item_id = server.decode_cursor(server.encode_cursor(value, "room_a"))
+
+    assert decoded == value and type(decoded) is type(value)
+    assert item_id == "room_a"
+
+
+def test_garbled_cursor_is_a_400():
+    with pytest.raises(HTTPException) as error:
+        server.decode_cursor("not-a-cursor")
+    assert error.value.status_code == 400
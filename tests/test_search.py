@@ -0,0 +1,25 @@
+from fastapi.testclient import TestClient
+
+import server
+
+client = TestClient(server.app)
+
+
+def test_job_search_rejects_a_non_positive_radius(fake_db):
+    for radius in ("-1", "0"):
+        response = client.get("/api/jobs", params={"lat": -34.6, "lng": -58.38, "radius_km": radius})
+        assert response.status_code == 422
+    assert fake_db.collections == {}  # rejected before reaching Mongo
+
+
+def test_worker_search_rejects_a_non_positive_radius(fake_db):
+    server.app.dependency_overrides[server.require_auth] = lambda: server.User(
+        user_id="user_business", email="cafe@example.com", name="Café Central", role="business"
+    )
+    try:
+        response = client.get("/api/workers/search", params={"lat": -34.6, "lng": -58.38, "radius_km": -5})
+    finally:
+        server.app.dependency_overrides.clear()
+
+    assert response.status_code == 422
+    assert fake_db.collections == {}
@@ -0,0 +1,55 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def session_db(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "session_cache", server.TTLCache(100, 60))
+    fake_db.add("user_sessions", [{
+        "session_token": "token_1", "user_id": "user_1",
+        "expires_at": datetime.now(timezone.utc) + timedelta(days=1)
+    }])
+    fake_db.add("users", [{"user_id": "user_1", "email": "a@example.com", "name": "A", "role": "worker"}])
+    return fake_db
+
+
+def during_user_lookup(db, change):
+    """Run change() while resolve_session is between its session and user reads"""
+    find_one = db.users.find_one
+
+    async def racing_find_one(*args, **kwargs):
+        await change()
+        return await find_one(*args, **kwargs)
+
+    db.users.find_one = racing_find_one
+
+
+def test_logout_during_a_lookup_is_not_undone_by_the_cache(session_db):
+    async def logout():
+        await session_db.user_sessions.delete_many({"session_token": "token_1"})
+        server.session_cache.pop("token_1")
+
+    during_user_lookup(session_db, logout)
+    asyncio.run(server.resolve_session("token_1"))
+
+    assert server.session_cache.get("token_1") is None
+    assert asyncio.run(server.resolve_session("token_1")) is None
+
+
+def test_role_change_during_a_lookup_leaves_no_stale_role_cached(session_db):
+    async def set_role():
+        await session_db.users.update_one({"user_id": "user_1"}, {"$set": {"role": "business"}})
+        server.invalidate_user_sessions("user_1")
+
+    during_user_lookup(session_db, set_role)
+    asyncio.run(server.resolve_session("token_1"))
+    del session_db.users.find_one  # back to the plain fake
+
+    assert server.session_cache.get("token_1") is None
+    assert asyncio.run(server.resolve_session("token_1")).role == "business"
+    # Without a concurrent invalidation the lookup is cached as usual
+    assert server.session_cache.get("token_1").role == "business"
@@ -0,0 +1,92 @@
+import asyncio
+from datetime import datetime, timezone
+
+from fastapi.testclient import TestClient
+
+import server
+
+# Required skills of open jobs: catalog, free-text and differently spelled
+JOB_SKILLS = [
+    ["Barista", "Latte art"],
+    ["Latte art"],
+    ["barista"],
+    [],
+    ["Cocina", " Caja  registradora", "Arte  culinario"],
+]
+WORKER_SKILLS = [[], ["Barista"], ["Barista", "Latte art"], ["cocina", "Arte culinario"]]
+
+
+def baseline_match_score(worker_skills, required_skills):
+    """The pre-bitmask set arithmetic, on normalized names"""
+    required = {server.normalize_skill(skill) for skill in required_skills}
+    if not required:
+        return 50.0
+    worker = {server.normalize_skill(skill) for skill in worker_skills}
+    return len(worker & required) / len(required) * 100
+
+
+def test_register_skills_normalizes_and_only_allocates_catalog_skills(fake_db):
+    bits = asyncio.run(server.register_skills(["  barista ", "Atención   al cliente", "BARISTA", "Malabares"]))
+
+    assert bits == {"Barista": 0, "Atención al cliente": 1}
+    assert {entry["skill"]: entry["bit"] for entry in fake_db.skill_registry.docs} == bits
+
+
+def test_skills_filter_reads_skills_registered_by_another_worker(fake_db):
+    # Registered by another process: this one has not loaded them yet
+    registry = fake_db.add("skill_registry", [{"skill": "Excel", "bit": 5}, {"skill": "Inglés", "bit": 7}])
+
+    condition = asyncio.run(server.skills_filter(["excel", "Inglés"], "skills"))
+    # Cached after the first lookup
+    again = asyncio.run(server.skills_filter(["Excel"], "skills", "any"))
+
+    assert sorted(condition["skills_mask"]["$bitsAllSet"]) == [5, 7]
+    assert again == {"skills_mask": {"$bitsAnySet": [5]}}
+    # Filtering never allocates bits
+    assert len(registry.docs) == 2
+    assert len(registry.calls) == 1
+
+
+def test_free_text_skills_are_filtered_on_their_stored_names(fake_db):
+    asyncio.run(server.load_skill_registry())
+
+    condition = asyncio.run(server.skills_filter(["Barista", "Latte  art"], "skills_required"))
+    either = asyncio.run(server.skills_filter(["Latte art"], "skills_required", "any"))
+
+    assert condition["skills_mask"] == {"$bitsAllSet": [server.skill_bits["Barista"]]}
+    [pattern] = condition["skills_required"]["$all"]
+    assert pattern.match(" Latte   art") and not pattern.match("Latte artista")
+    assert either == {"skills_required": {"$in": [pattern]}}
+
+
+def test_apply_match_score_follows_the_baseline_formula(fake_db):
+    asyncio.run(server.load_skill_registry())
+    fake_db.add("jobs", [
+        {"job_id": f"job_{i}", "status": "open", "skills_required": skills} for i, skills in enumerate(JOB_SKILLS)
+    ])
+    fake_db.add("applications", unique=[("job_id", "worker_user_id")])
+    client = TestClient(server.app)
+
+    for w, worker_skills in enumerate(WORKER_SKILLS):
+        user_id = f"user_{w}"
+        fake_db.profiles.docs.append({"user_id": user_id, "role": "worker", "skills": worker_skills})
+        server.app.dependency_overrides[server.require_auth] = lambda user_id=user_id: server.User(
+            user_id=user_id, email=f"{user_id}@example.com", name="Worker", role="worker"
+        )
+        for i, required_skills in enumerate(JOB_SKILLS):
+            response = client.post(f"/api/jobs/job_{i}/apply", json={})
+            assert response.status_code == 200
+            assert response.json()["match_score"] == baseline_match_score(worker_skills, required_skills)
+    server.app.dependency_overrides.clear()
+
+
+def test_recommendation_feed_scores_skills_like_apply(fake_db):
+    asyncio.run(server.load_skill_registry())
+    now = datetime.now(timezone.utc)
+    features = server.JobFeatures([
+        {"job_id": f"job_{i}", "skills_required": skills, "created_at": now} for i, skills in enumerate(JOB_SKILLS)
+    ])
+
+    for worker_skills in WORKER_SKILLS:
+        expected = [server.skill_match_score(worker_skills, required) for required in JOB_SKILLS]
+        assert features.skill_match(worker_skills).tolist() == expected
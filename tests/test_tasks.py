@@ -0,0 +1,95 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+
+import server
+
+
+def completed_job(fake_db, status="completed"):
+    fake_db.add("jobs", [{
+        "job_id": "job_1", "business_user_id": "user_business", "assigned_worker_id": "user_worker",
+        "status": status, "created_at": datetime.now(timezone.utc)
+    }])
+    fake_db.add("profiles", [{"user_id": "user_worker", "role": "worker", "completed_jobs": 0, "prestige_score": 0}])
+
+
+async def run_due_tasks(queue):
+    while task := await queue.claim():
+        await queue.run(task)
+
+
+def test_rerunning_a_task_applies_its_side_effect_once(fake_db):
+    completed_job(fake_db)
+    queue = server.TaskQueue(1)
+    payload = {"job_id": "job_1", "worker_user_id": "user_worker"}
+
+    async def main():
+        await queue.enqueue("job_completed", payload)
+        await run_due_tasks(queue)
+        # A crash before the done marker (no transactions) runs the handler again
+        await server.apply_job_completion(payload, None)
+
+    asyncio.run(main())
+
+    profile = fake_db.profiles.docs[0]
+    assert (profile["completed_jobs"], profile["prestige_score"]) == (1, 10)
+    assert profile["applied_tasks"] == ["job_1"]
+    assert fake_db.task_outbox.docs[0]["status"] == "done"
+
+
+def test_task_without_its_primary_write_is_retried_then_failed(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "TASK_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(server, "TASK_RETRY_BASE_SECONDS", 0)
+    completed_job(fake_db, status="in_progress")
+    queue = server.TaskQueue(1)
+    outbox = fake_db.task_outbox
+
+    async def main():
+        await queue.enqueue("job_completed", {"job_id": "job_1", "worker_user_id": "user_worker"})
+        await queue.run(await queue.claim())
+        retried = dict(outbox.docs[0])
+        await queue.run(await queue.claim())
+        return retried
+
+    retried = asyncio.run(main())
+
+    assert (retried["status"], retried["attempts"]) == ("pending", 1)
+    assert "not completed" in retried["last_error"]
+    assert (outbox.docs[0]["status"], outbox.docs[0]["attempts"]) == ("failed", 2)
+    assert queue.stats == {"enqueued": 1, "completed": 0, "retried": 1, "failed": 1}
+    assert fake_db.profiles.docs[0]["completed_jobs"] == 0
+
+
+def test_duplicate_review_discards_its_task(fake_db):
+    completed_job(fake_db)
+    fake_db.add("reviews", [{"review_id": "rev_1", "job_id": "job_1", "reviewer_user_id": "user_business"}],
+                unique=[("job_id", "reviewer_user_id")])
+    server.app.dependency_overrides[server.require_auth] = lambda: server.User(
+        user_id="user_business", email="cafe@example.com", name="Café Central", role="business"
+    )
+    try:
+        response = TestClient(server.app).post("/api/jobs/job_1/review", json={"rating": 5, "comment": "Otra vez"})
+    finally:
+        server.app.dependency_overrides.clear()
+
+    assert response.status_code == 400
+    assert len(fake_db.reviews.docs) == 1
+    assert fake_db.task_outbox.docs == []
+
+
+def test_task_left_running_by_a_crashed_worker_is_reclaimed_after_its_lease(fake_db):
+    completed_job(fake_db)
+    now = datetime.now(timezone.utc)
+    fake_db.add("task_outbox", [
+        {"task_id": "task_live", "kind": "job_completed", "status": "running", "attempts": 1,
+         "locked_until": now + timedelta(minutes=1), "payload": {}},
+        {"task_id": "task_crashed", "kind": "job_completed", "status": "running", "attempts": 1,
+         "locked_until": now - timedelta(seconds=1), "payload": {"job_id": "job_1", "worker_user_id": "user_worker"}},
+    ])
+
+    claimed = asyncio.run(server.TaskQueue(1).claim())
+
+    assert claimed["task_id"] == "task_crashed"
+    assert claimed["attempts"] == 2
+    assert claimed["locked_until"] > now